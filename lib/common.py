@@ -1,4 +1,5 @@
 import datetime
+import email.utils
 import os
 import subprocess
 import time
@@ -132,12 +133,13 @@ class ThreadedDownloadAndCache(QtCore.QThread):
     file_done = QtCore.pyqtSignal(object, str, int, int)
     finished = QtCore.pyqtSignal()
 
-    def __init__(self, cache_dir_name: str, urls: Dict[str, str], max_age: int = None, cleanup_age: int = None):
+    def __init__(self, cache_dir_name: str, urls: Dict[str, str], max_age: int = None, cleanup_age: int = None, cleanup_size: int = None):
         QtCore.QThread.__init__(self)
 
         self.urls = urls
         self.max_age = max_age
         self.cleanup_age = cleanup_age
+        self.cleanup_size = cleanup_size
         self.stop_requested = False
 
         self.cache_dir = get_cache_path(cache_dir_name)
@@ -153,7 +155,17 @@ class ThreadedDownloadAndCache(QtCore.QThread):
             file_age = None
 
         if file_age is None or (self.max_age is not None and file_age >= self.max_age):
-            with requests.get(url, stream=True) as response:
+            headers = {}
+
+            # Only download the file again if it has been changed since the last download
+            if file_age is not None:
+                headers["If-Modified-Since"] = email.utils.formatdate(os.path.getmtime(filename_path), usegmt=True)
+
+            with requests.get(url, stream=True, headers=headers) as response:
+                if file_age is not None and response.status_code == 304:
+                    os.utime(filename_path)
+                    return filename_path
+
                 response.raise_for_status()
 
                 with open(filename_path, "wb") as cache_file:
@@ -170,10 +182,40 @@ class ThreadedDownloadAndCache(QtCore.QThread):
                 if not os.path.isfile(filename_path):
                     continue
 
-                file_age = time.time() - os.path.getmtime(filename_path)
+                try:
+                    file_age = time.time() - os.path.getmtime(filename_path)
+
+                    if file_age >= self.cleanup_age:
+                        os.unlink(filename_path)
+                except FileNotFoundError:
+                    # Removed by another download in the meantime
+                    pass
+
+        if self.cleanup_size is not None and os.path.isdir(self.cache_dir):
+            files = []
+
+            for dir_item in os.listdir(self.cache_dir):
+                filename_path = os.path.join(self.cache_dir, dir_item)
+
+                try:
+                    if os.path.isfile(filename_path):
+                        files.append((os.path.getmtime(filename_path), os.path.getsize(filename_path), filename_path))
+                except FileNotFoundError:
+                    pass
+
+            total_size = sum(file_size for file_mtime, file_size, filename_path in files)
+
+            # Remove the oldest files until the cache fits into the size limit
+            for file_mtime, file_size, filename_path in sorted(files):
+                if total_size <= self.cleanup_size:
+                    break
 
-                if file_age >= self.cleanup_age:
+                try:
                     os.unlink(filename_path)
+                except FileNotFoundError:
+                    pass
+
+                total_size -= file_size
 
         paths = {}
 
@@ -255,6 +297,44 @@ class Timer(QtCore.QObject):
         return time.time() * 1000
 
 
+class DayChangeTimer(QtCore.QObject):
+    day_changed = QtCore.pyqtSignal(object, object)
+
+    # Check at least once per hour as timers do not advance while the system is suspended
+    max_interval = 60 * 60 * 1000
+
+    def __init__(self, parent):
+        super().__init__(parent)
+
+        self.today = datetime.date.today()
+
+        self.timer = QtCore.QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.timeout.connect(self.check_day)
+
+        self.schedule()
+
+    def schedule(self):
+        now = datetime.datetime.now()
+        next_midnight = datetime.datetime.combine(now.date() + datetime.timedelta(days=1), datetime.time.min)
+
+        # Wake up slightly after midnight to make sure the date has actually changed
+        interval = int((next_midnight - now).total_seconds() * 1000) + 1000
+
+        self.timer.start(min(interval, self.max_interval))
+
+    def check_day(self):
+        today = datetime.date.today()
+
+        if today != self.today:
+            previous_day = self.today
+            self.today = today
+
+            self.day_changed.emit(previous_day, today)
+
+        self.schedule()
+
+
 class HorizontalScrollArea(QtWidgets.QScrollArea):
     def __init__(self):
         super().__init__()
@@ -13,7 +13,7 @@ import vobject.base
 from PyQt5 import QtCore, QtWidgets, QtGui
 from caldav.elements import ical
 
-from lib.common import Timer, AbstractView, get_dashboard_instance
+from lib.common import Timer, AbstractView, DayChangeTimer, get_dashboard_instance
 
 
 # Also used in Tasks module
@@ -196,12 +196,10 @@ class CalendarEventDialog(QtWidgets.QDialog):
 
 
 class Event:
-    def __init__(self, vobject_instance: vobject.base.Component, calendar: Calendar, upcoming_days: int, past_days: int):
+    def __init__(self, vobject_instance: vobject.base.Component, calendar: Calendar):
         self.vobject = vobject_instance
         self.vevent = vobject_instance.vevent
         self.calendar = calendar
-        self.upcoming_days = upcoming_days
-        self.past_days = past_days
 
     def get_recurrence_ids(self):
         recurrence_ids = {}
@@ -221,19 +219,17 @@ class Event:
 
         return recurrence_ids
 
-    def get_dates(self):
+    def is_recurring(self):
+        return bool(self.vevent.getChildValue("rrule"))
+
+    def get_dates(self, range_start: datetime.datetime, range_end: datetime.datetime):
         rrule = self.vevent.getChildValue("rrule")
         if rrule:
-            return self.get_from_rrule(rrule)
+            return self.get_from_rrule(rrule, range_start, range_end)
         else:
             return self.get_in_range(self.vevent.getChildValue("dtstart"), self.vevent.getChildValue("dtend"))
 
-    def get_from_rrule(self, rrule):
-        today_date = datetime.date.today()
-        today = datetime.datetime(today_date.year, today_date.month, today_date.day)
-        range_start = today - datetime.timedelta(days=self.past_days)
-        range_end = today + datetime.timedelta(days=self.upcoming_days)
-
+    def get_from_rrule(self, rrule, range_start: datetime.datetime, range_end: datetime.datetime):
         start_datetime = self.vevent.getChildValue("dtstart")
         end_datetime = self.vevent.getChildValue("dtend")
         if isinstance(start_datetime, datetime.datetime):
@@ -470,8 +466,14 @@ class View(QtWidgets.QWidget, AbstractView):
         calendar_manager = CalendarManager(url, username, password)
 
         self.events = {}
+        self.recurring_events: List[Event] = []
+        self.today = None
         self.search_filter = ""
 
+        self.highlight_format = QtGui.QTextCharFormat()
+        self.highlight_format.setFontUnderline(True)
+        self.highlight_format.setForeground(QtGui.QBrush(QtGui.QColor(self.highlight_color)))
+
         self.updater = Updater(calendar_manager.unfiltered_calendars, upcoming_days, past_days)
         self.updater.ready.connect(self.update_events)
 
@@ -510,6 +512,9 @@ class View(QtWidgets.QWidget, AbstractView):
         timer = Timer(self, 300000, self)
         timer.timeout.connect(self.updater.start)
 
+        day_change_timer = DayChangeTimer(self)
+        day_change_timer.day_changed.connect(self.roll_over_day)
+
     def show_add_event_dialog(self, position: QtCore.QPoint = None):
         dialog = CalendarEventDialog(self, self.calendars, self.calendar_widget.selectedDate(), self.default_calendar, self.updater)
 
@@ -519,13 +524,54 @@ class View(QtWidgets.QWidget, AbstractView):
     def jump_to_today(self):
         self.calendar_widget.setSelectedDate(QtCore.QDate.currentDate())
 
+    def get_date_range(self):
+        today = datetime.datetime.combine(self.today, datetime.datetime.min.time())
+
+        return today - datetime.timedelta(days=self.past_days), today + datetime.timedelta(days=self.upcoming_days)
+
+    def update_date_range(self):
+        range_start, range_end = self.get_date_range()
+
+        self.calendar_widget.setMinimumDate(QtCore.QDate(range_start.year, range_start.month, range_start.day))
+        self.calendar_widget.setMaximumDate(QtCore.QDate(range_end.year, range_end.month, range_end.day))
+
+    def set_today_format(self, date: datetime.date, is_today: bool):
+        date_object = QtCore.QDate(date.year, date.month, date.day)
+
+        if date.strftime("%Y-%m-%d") in self.events:
+            text_format = QtGui.QTextCharFormat(self.highlight_format)
+        else:
+            text_format = QtGui.QTextCharFormat()
+
+        if is_today:
+            text_format.setFontWeight(QtGui.QFont.Bold)
+
+        self.calendar_widget.setDateTextFormat(date_object, text_format)
+
+    def add_event_date(self, date: datetime.datetime, event: Event):
+        date_string = date.strftime("%Y-%m-%d")
+        if date_string not in self.events:
+            self.events[date_string] = []
+
+        # Recurrence overrides are returned independent of the requested range and might already be known
+        if (date, event) in self.events[date_string]:
+            return False
+
+        self.events[date_string].append((date, event))
+
+        date_object = QtCore.QDate(date.year, date.month, date.day)
+        self.calendar_widget.setDateTextFormat(date_object, self.highlight_format)
+
+        if date.date() == self.today:
+            self.set_today_format(self.today, True)
+
+        return True
+
     def update_events(self, events_per_calendar: Dict[str, List[caldav.Event]]):
-        today = datetime.date.today()
-        start_date = today - datetime.timedelta(days=self.past_days)
-        end_date = today + datetime.timedelta(days=self.upcoming_days)
+        self.today = datetime.date.today()
+        range_start, range_end = self.get_date_range()
 
-        self.calendar_widget.setMinimumDate(QtCore.QDate(start_date.year, start_date.month, start_date.day))
-        self.calendar_widget.setMaximumDate(QtCore.QDate(end_date.year, end_date.month, end_date.day))
+        self.update_date_range()
 
         for date in self.calendar_widget.dateTextFormat().keys():
             self.calendar_widget.setDateTextFormat(date, QtGui.QTextCharFormat())
@@ -533,40 +579,63 @@ class View(QtWidgets.QWidget, AbstractView):
         self.calendar_widget.setWeekdayTextFormat(QtCore.Qt.Saturday, QtGui.QTextCharFormat())
         self.calendar_widget.setWeekdayTextFormat(QtCore.Qt.Sunday, QtGui.QTextCharFormat())
 
-        today_format = QtGui.QTextCharFormat()
-        today_format.setFontWeight(QtGui.QFont.Bold)
-        self.calendar_widget.setDateTextFormat(QtCore.QDate(today.year, today.month, today.day), today_format)
-
-        highlight_format = QtGui.QTextCharFormat()
-        highlight_format.setFontUnderline(True)
-        highlight_format.setForeground(QtGui.QBrush(QtGui.QColor(self.highlight_color)))
-
         self.events = {}
+        self.recurring_events = []
+
+        self.set_today_format(self.today, True)
 
         for calendar_url, events in events_per_calendar.items():
             for event in events:
-                event = Event(event.vobject_instance, self.calendars[calendar_url], self.upcoming_days, self.past_days)
+                event = Event(event.vobject_instance, self.calendars[calendar_url])
 
-                for date in event.get_dates():
-                    date_object = QtCore.QDate(date.year, date.month, date.day)
-                    self.calendar_widget.setDateTextFormat(date_object, highlight_format)
+                if event.is_recurring():
+                    self.recurring_events.append(event)
 
-                    if date.date() == today:
-                        text_format: QtGui.QTextCharFormat = self.calendar_widget.dateTextFormat(date_object)
-                        text_format.setFontWeight(QtGui.QFont.Bold)
-                        self.calendar_widget.setDateTextFormat(date_object, text_format)
-
-                    date_string = date.strftime("%Y-%m-%d")
-                    if date_string not in self.events:
-                        self.events[date_string] = []
-
-                    self.events[date_string].append((date, event))
+                for date in event.get_dates(range_start, range_end):
+                    self.add_event_date(date, event)
 
         self.events = OrderedDict(sorted(self.events.items()))
 
         self.event_list_widget.update_list(self.events, self.search_filter)
         self.scroll_to_selected_date()
 
+    def roll_over_day(self, previous_day: datetime.date, today: datetime.date):
+        # Only a single day can be shifted incrementally, anything else (e.g. after suspend) requires a full refresh
+        if self.today != previous_day or today - previous_day != datetime.timedelta(days=1):
+            self.updater.start()
+            return
+
+        _, previous_range_end = self.get_date_range()
+
+        self.today = today
+        range_start, range_end = self.get_date_range()
+
+        self.update_date_range()
+
+        range_start_string = range_start.strftime("%Y-%m-%d")
+        changed = False
+
+        for date_string in [date_string for date_string in self.events.keys() if date_string < range_start_string]:
+            date = self.events.pop(date_string)[0][0]
+            self.calendar_widget.setDateTextFormat(QtCore.QDate(date.year, date.month, date.day), QtGui.QTextCharFormat())
+            changed = True
+
+        # Non-recurring events are not limited to the date range, so only recurring events have to be expanded for the new day
+        new_day_start = previous_range_end + datetime.timedelta(microseconds=1)
+
+        for event in self.recurring_events:
+            for date in event.get_dates(new_day_start, range_end):
+                if self.add_event_date(date, event):
+                    changed = True
+
+        self.set_today_format(previous_day, False)
+        self.set_today_format(today, True)
+
+        if changed:
+            self.events = OrderedDict(sorted(self.events.items()))
+
+            self.event_list_widget.update_list(self.events, self.search_filter)
+
     def scroll_to_selected_date(self):
         self.event_list_widget.scroll_to_date(self.calendar_widget.selectedDate())
 
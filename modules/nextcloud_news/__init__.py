@@ -1,15 +1,26 @@
 import datetime
+import functools
+import hashlib
+import html
+import json
 import os
 import re
+import shlex
+import signal
+import sqlite3
 import subprocess
-from collections import OrderedDict
+import threading
+import time
+import traceback
+from collections import OrderedDict, deque
 from enum import Enum
+from typing import List
 
 import pyperclip
 import requests
 from PyQt5 import QtWidgets, QtCore, QtGui
 
-from lib.common import AbstractView, ThreadedCall, Timer, get_dashboard_instance
+from lib.common import AbstractView, ThreadedCall, ThreadedDownloadAndCache, Timer, get_dashboard_instance, get_cache_path, is_visible
 
 
 class ItemAction(Enum):
@@ -17,56 +28,1101 @@ class ItemAction(Enum):
     COLLAPSE = "collapse"
 
 
+class ItemOptions:
+    def __init__(self, item_options):
+        self.values = {}
+        self.regexes = {}
+        self.verdicts = {}
+
+        patterns = {}
+
+        for item in item_options or []:
+            key = (item["type"], item["action"])
+
+            if "value" in item:
+                self.values.setdefault(key, set()).add(item["value"])
+            elif "regex" in item:
+                patterns.setdefault(key, []).append(item["regex"])
+
+        for key, key_patterns in patterns.items():
+            self.regexes[key] = self.compile_patterns(key_patterns)
+
+    @staticmethod
+    def compile_patterns(patterns):
+        regexes = [re.compile(pattern) for pattern in patterns]
+
+        # Patterns containing groups (which might be referenced) or global flags can not be combined into a single regex
+        combinable_patterns = [regex.pattern for regex in regexes if regex.groups == 0 and not regex.pattern.startswith("(?")]
+        other_regexes = [regex for regex in regexes if regex.pattern not in combinable_patterns]
+
+        if len(combinable_patterns) > 1:
+            return [re.compile("|".join("(?:{})".format(pattern) for pattern in combinable_patterns))] + other_regexes
+
+        return regexes
+
+    def check(self, item_type: str, value: str, action: "ItemAction"):
+        key = (item_type, action.value)
+
+        if value in self.values.get(key, ()):
+            return True
+
+        return any(regex.match(value) for regex in self.regexes.get(key, ()))
+
+    def check_cached(self, item_type: str, value: str, action: "ItemAction"):
+        key = (item_type, value, action)
+
+        if key not in self.verdicts:
+            self.verdicts[key] = self.check(item_type, value, action)
+
+        return self.verdicts[key]
+
+
+def iter_json_array(chunks, key: str):
+    # Yield the elements of the array with the given key while the response is still being received
+    decoder = json.JSONDecoder()
+    key_regex = re.compile(r'"{}"\s*:\s*\['.format(re.escape(key)))
+    buffer = ""
+    in_array = False
+
+    for chunk in chunks:
+        buffer += chunk
+
+        if not in_array:
+            match = key_regex.search(buffer)
+
+            if match is None:
+                continue
+
+            buffer = buffer[match.end():]
+            in_array = True
+
+        while True:
+            buffer = buffer.lstrip(" \t\r\n,")
+
+            if not buffer:
+                break
+
+            if buffer[0] == "]":
+                return
+
+            try:
+                element, end = decoder.raw_decode(buffer)
+            except ValueError:
+                # Element not yet complete
+                break
+
+            yield element
+
+            buffer = buffer[end:]
+
+    # A truncated response must not be taken as the complete list
+    if not in_array:
+        raise ValueError("Key {} not found in response".format(key))
+
+    raise ValueError("Response ended before the end of {}".format(key))
+
+
+class ItemStore:
+    def __init__(self, filename: str):
+        os.makedirs(os.path.dirname(filename), exist_ok=True)
+
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(filename, check_same_thread=False)
+
+        with self.connection:
+            self.connection.executescript("""
+                CREATE TABLE IF NOT EXISTS folders (id INTEGER PRIMARY KEY, name TEXT NOT NULL);
+                CREATE TABLE IF NOT EXISTS feeds (id INTEGER PRIMARY KEY, data TEXT NOT NULL);
+                CREATE TABLE IF NOT EXISTS items (id INTEGER PRIMARY KEY, title TEXT, author TEXT, body TEXT, data TEXT NOT NULL);
+                CREATE TABLE IF NOT EXISTS state (name TEXT PRIMARY KEY, value);
+            """)
+
+        try:
+            with self.connection:
+                self.connection.executescript("""
+                    CREATE VIRTUAL TABLE IF NOT EXISTS items_fts USING fts5(title, author, body, content='items', content_rowid='id');
+                    CREATE TRIGGER IF NOT EXISTS items_insert AFTER INSERT ON items BEGIN
+                        INSERT INTO items_fts (rowid, title, author, body) VALUES (new.id, new.title, new.author, new.body);
+                    END;
+                    CREATE TRIGGER IF NOT EXISTS items_delete AFTER DELETE ON items BEGIN
+                        INSERT INTO items_fts (items_fts, rowid, title, author, body) VALUES ('delete', old.id, old.title, old.author, old.body);
+                    END;
+                    CREATE TRIGGER IF NOT EXISTS items_update AFTER UPDATE ON items BEGIN
+                        INSERT INTO items_fts (items_fts, rowid, title, author, body) VALUES ('delete', old.id, old.title, old.author, old.body);
+                        INSERT INTO items_fts (rowid, title, author, body) VALUES (new.id, new.title, new.author, new.body);
+                    END;
+                """)
+
+            self.full_text_search = True
+        except sqlite3.OperationalError:
+            # SQLite has been compiled without FTS5
+            traceback.print_exc()
+            self.full_text_search = False
+
+    def get_state(self, name: str, default=None):
+        with self.lock:
+            row = self.connection.execute("SELECT value FROM state WHERE name = ?", (name,)).fetchone()
+
+        if row is None:
+            return default
+
+        return row[0]
+
+    def set_state(self, name: str, value):
+        with self.lock, self.connection:
+            self.connection.execute("INSERT OR REPLACE INTO state (name, value) VALUES (?, ?)", (name, value))
+
+    def get_folders(self):
+        with self.lock:
+            return {folder_id: name for folder_id, name in self.connection.execute("SELECT id, name FROM folders")}
+
+    def set_folders(self, folders: dict):
+        with self.lock, self.connection:
+            self.connection.execute("DELETE FROM folders")
+            self.connection.executemany("INSERT INTO folders (id, name) VALUES (?, ?)", folders.items())
+
+    def get_feeds(self):
+        with self.lock:
+            return {feed_id: json.loads(data) for feed_id, data in self.connection.execute("SELECT id, data FROM feeds")}
+
+    def set_feeds(self, feeds: dict):
+        with self.lock, self.connection:
+            self.connection.execute("DELETE FROM feeds")
+            self.connection.executemany("INSERT INTO feeds (id, data) VALUES (?, ?)", [(feed_id, json.dumps(feed)) for feed_id, feed in feeds.items()])
+
+    def get_items(self):
+        items = []
+
+        with self.lock:
+            # Bodies are only loaded when required (see get_bodies)
+            for (data,) in self.connection.execute("SELECT data FROM items ORDER BY id DESC"):
+                items.append(json.loads(data))
+
+        return items
+
+    def get_bodies(self, item_ids: List[int]):
+        with self.lock:
+            return dict(self.connection.execute("SELECT id, body FROM items WHERE id IN ({})".format(", ".join("?" * len(item_ids))), item_ids))
+
+    def update_items(self, items: List[dict], state_name: str, last_modified: int, replace=False, feed_ids: List[int] = None):
+        unread_items = []
+        read_ids = []
+
+        for item in items:
+            if item["unread"]:
+                data = dict(item)
+                body = data.pop("body", None)
+
+                unread_items.append((int(item["id"]), item["title"], item.get("author"), body, json.dumps(data)))
+            else:
+                read_ids.append((int(item["id"]),))
+
+        # Write all changes of an update at once
+        with self.lock, self.connection:
+            if replace and feed_ids is None:
+                self.connection.execute("DELETE FROM items")
+            elif replace:
+                self.connection.execute("DELETE FROM items WHERE json_extract(data, '$.feedId') IN ({})".format(", ".join("?" * len(feed_ids))), feed_ids)
+
+            self.connection.executemany("""
+                INSERT INTO items (id, title, author, body, data) VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT (id) DO UPDATE SET title = excluded.title, author = excluded.author, body = excluded.body, data = excluded.data
+            """, unread_items)
+            self.connection.executemany("DELETE FROM items WHERE id = ?", read_ids)
+            self.connection.execute("INSERT OR REPLACE INTO state (name, value) VALUES (?, ?)", (state_name, last_modified))
+
+    def remove_items(self, item_ids):
+        with self.lock, self.connection:
+            self.connection.executemany("DELETE FROM items WHERE id = ?", [(int(item_id),) for item_id in item_ids])
+
+    def search(self, text: str):
+        if self.full_text_search:
+            # Match each word as prefix while escaping any FTS query syntax
+            query = " ".join("\"{}\"*".format(word.replace("\"", "\"\"")) for word in text.split())
+            sql = "SELECT rowid FROM items_fts WHERE items_fts MATCH ?"
+            parameters = [query]
+        else:
+            words = text.split()
+            sql = "SELECT id FROM items WHERE {}".format(" AND ".join(["(title LIKE ? OR author LIKE ? OR body LIKE ?)"] * len(words)))
+            parameters = [value for word in words for value in ["%{}%".format(word)] * 3]
+
+        with self.lock:
+            return {row[0] for row in self.connection.execute(sql, parameters)}
+
+
 class Updater(QtCore.QThread):
     ready = QtCore.pyqtSignal(list)
+    unread_count_ready = QtCore.pyqtSignal(int)
+
+    # Folders and feeds rarely change, therefore only revalidate them once in a while
+    feeds_max_age = 60 * 60
+
+    # Number of items written to the store at once while receiving them
+    chunk_size = 1000
+
+    # Number of folders and feeds fetched at the same time
+    max_concurrent_requests = 4
 
-    def __init__(self, base_url, auth):
+    def __init__(self, base_url, auth, item_store: ItemStore, show_folders=None, hide_folders=None, max_items=None):
         QtCore.QThread.__init__(self)
 
         self.base_url = base_url
+        self.max_items = max_items
+        self.show_folders = show_folders
+        self.hide_folders = hide_folders
         self.auth = auth
 
-    def run(self):
-        request = requests.get("{}/folders".format(self.base_url), auth=self.auth)
+        # Sessions are not thread-safe, therefore each thread uses its own session sharing the connection pool
+        self.adapter = requests.adapters.HTTPAdapter()
+        self.thread_sessions = threading.local()
+        self.item_store = item_store
+        self.etags = {}
+        self.folders = item_store.get_folders()
+        self.folders[-1] = "No folder"
+        self.feeds = item_store.get_feeds()
+        self.folders_updated = item_store.get_state("folders_updated", 0)
+        self.feeds_updated = item_store.get_state("feeds_updated", 0)
+        self.last_modified = {}
+        self.unknown_feeds = False
 
-        folders = {
-            -1: "No folder"
-        }
+    def get_session(self):
+        session = getattr(self.thread_sessions, "session", None)
 
-        for folder in request.json()["folders"]:
-            folders[int(folder["id"])] = folder["name"]
+        if session is None:
+            session = requests.Session()
+            session.auth = self.auth
+            session.mount("http://", self.adapter)
+            session.mount("https://", self.adapter)
 
-        request = requests.get("{}/feeds".format(self.base_url), auth=self.auth)
+            self.thread_sessions.session = session
 
-        feeds = {}
+        return session
 
-        for feed in request.json()["feeds"]:
-            feeds[int(feed["id"])] = feed
+    def get_json(self, path, params=None, revalidate=False):
+        headers = {}
 
-        request = requests.get("{}/items".format(self.base_url), auth=self.auth, params={"type": 3, "getRead": "false", "batchSize": -1})
+        if revalidate and path in self.etags:
+            headers["If-None-Match"] = self.etags[path]
 
-        items = []
+        response = self.get_session().get("{}/{}".format(self.base_url, path), params=params, headers=headers)
+
+        if revalidate and response.status_code == 304:
+            return None
+
+        response.raise_for_status()
 
-        for item in request.json()["items"]:
-            if len(items) >= 1000:
+        if revalidate and "ETag" in response.headers:
+            self.etags[path] = response.headers["ETag"]
+
+        return response.json()
+
+    def iter_items(self, path, params):
+        with self.get_session().get("{}/{}".format(self.base_url, path), params=params, stream=True) as response:
+            response.raise_for_status()
+
+            if response.encoding is None:
+                response.encoding = "utf-8"
+
+            yield from iter_json_array(response.iter_content(chunk_size=65536, decode_unicode=True), "items")
+
+    def update_folders(self):
+        try:
+            data = self.get_json("folders", revalidate=True)
+        except:
+            traceback.print_exc()
+            return
+
+        if data is not None:
+            folders = {}
+
+            for folder in data["folders"]:
+                folders[int(folder["id"])] = folder["name"]
+
+            self.item_store.set_folders(folders)
+
+            folders[-1] = "No folder"
+            self.folders = folders
+
+        self.folders_updated = time.time()
+        self.item_store.set_state("folders_updated", self.folders_updated)
+
+    def update_feeds(self):
+        try:
+            data = self.get_json("feeds", revalidate=True)
+        except:
+            traceback.print_exc()
+            return False
+
+        if data is not None:
+            feeds = {}
+
+            for feed in data["feeds"]:
+                feeds[int(feed["id"])] = feed
+
+            self.item_store.set_feeds(feeds)
+            self.feeds = feeds
+
+        self.feeds_updated = time.time()
+        self.item_store.set_state("feeds_updated", self.feeds_updated)
+
+        return data is not None
+
+    def poll_unread_count(self):
+        # The feeds contain the number of unread items, which is enough to know whether there are new items
+        if not self.update_feeds():
+            return
+
+        self.unread_count_ready.emit(self.get_unread_count())
+
+    def get_unread_count(self):
+        unread_count = 0
+
+        for feed in self.feeds.values():
+            folder_id = feed["folderId"]
+
+            if folder_id is None:
+                folder_id = -1
+
+            if self.is_folder_shown(self.folders.get(int(folder_id), self.folders[-1])):
+                unread_count += int(feed.get("unreadCount", 0))
+
+        return unread_count
+
+    def is_folder_shown(self, folder_name: str):
+        if self.show_folders and folder_name not in self.show_folders:
+            return False
+
+        if self.hide_folders and folder_name in self.hide_folders:
+            return False
+
+        return True
+
+    def get_scopes(self):
+        # Scopes are tuples of item type (0 = feed, 1 = folder, 3 = all) and ID as used by the API plus the IDs of the covered feeds
+        if not self.show_folders and not self.hide_folders:
+            return [(3, 0, None)]
+
+        scopes = []
+
+        for folder_id, folder_name in self.folders.items():
+            if folder_id != -1 and self.is_folder_shown(folder_name):
+                scopes.append((1, folder_id, [feed_id for feed_id, feed in self.feeds.items() if feed["folderId"] == folder_id]))
+
+        if self.is_folder_shown(self.folders[-1]):
+            scopes.extend((0, feed_id, [feed_id]) for feed_id, feed in self.feeds.items() if feed["folderId"] is None)
+
+        return scopes
+
+    def update_items(self, item_type: int, item_id: int, feed_ids: List[int]):
+        if feed_ids is None:
+            state_name = "last_modified"
+        else:
+            state_name = "last_modified:{}:{}".format(item_type, item_id)
+
+        if state_name not in self.last_modified:
+            self.last_modified[state_name] = self.item_store.get_state(state_name)
+
+        last_modified = self.last_modified[state_name]
+
+        if last_modified is None:
+            items = self.iter_items("items", {"type": item_type, "id": item_id, "getRead": "false", "batchSize": -1})
+        else:
+            # Only fetch items which have been changed since the last update (including items marked as read)
+            items = self.iter_items("items/updated", {"type": item_type, "id": item_id, "lastModified": last_modified})
+
+        # Only limit the initial update, the changes of later updates must not be skipped
+        max_items = self.max_items if last_modified is None else None
+
+        new_last_modified = last_modified
+        chunk = []
+        received_items = 0
+        written_items = 0
+        next_emit = self.chunk_size
+
+        for item in items:
+            if new_last_modified is None or int(item["lastModified"]) > new_last_modified:
+                new_last_modified = int(item["lastModified"])
+
+            # Stop receiving once the limit has been reached
+            if max_items is not None and received_items >= max_items:
                 break
 
-            feed = feeds[int(item["feedId"])]
+            chunk.append(item)
+            received_items += 1
+
+            if len(chunk) < self.chunk_size:
+                continue
+
+            # Keep the state until all items have been received, an interrupted update has to be repeated
+            self.item_store.update_items(chunk, state_name, last_modified, last_modified is None and written_items == 0, feed_ids)
+
+            written_items += len(chunk)
+            chunk = []
+
+            # Show the first items while receiving the rest (with increasing intervals to keep the overhead low)
+            if written_items >= next_emit and self.feeds:
+                self.ready.emit(self.get_items())
+                next_emit *= 2
+
+        self.item_store.update_items(chunk, state_name, new_last_modified, last_modified is None and written_items == 0, feed_ids)
+
+        self.last_modified[state_name] = new_last_modified
+
+    def update_scopes(self, scopes: list, failed_scopes: list):
+        for scope in scopes:
+            try:
+                self.update_items(*scope)
+            except:
+                traceback.print_exc()
+                failed_scopes.append(scope)
+
+    def remove_items(self, item_ids):
+        self.item_store.remove_items(item_ids)
+
+    def get_items(self):
+        items = []
+        self.unknown_feeds = False
+
+        # Same order as returned by the API (newest first)
+        for item in self.item_store.get_items():
+            feed = self.feeds.get(int(item["feedId"]))
+
+            # Feed might have been removed or added in the meantime
+            if feed is None:
+                self.unknown_feeds = True
+                continue
+
             folder_id = feed["folderId"]
 
             if folder_id is None:
                 folder_id = -1
 
-            item["folder"] = folders[int(folder_id)]
+            item["folder"] = self.folders.get(int(folder_id), self.folders[-1])
             item["feed"] = feed["title"]
 
             items.append(item)
 
+        return items
+
+    def run(self):
+        now = time.time()
+
+        # Revalidate folders and feeds while fetching and parsing the items
+        lookup_threads = []
+
+        if now - self.folders_updated > self.feeds_max_age:
+            lookup_threads.append(ThreadedCall(None, self.update_folders))
+
+        if now - self.feeds_updated > self.feeds_max_age:
+            lookup_threads.append(ThreadedCall(None, self.update_feeds))
+
+        for thread in lookup_threads:
+            thread.start()
+
+        scoped = self.show_folders or self.hide_folders
+
+        if scoped and not self.feeds:
+            # Folders and feeds are required to know which items to fetch
+            for thread in lookup_threads:
+                thread.wait()
+
+        # Fetch the items of the shown folders and feeds using a limited number of requests at the same time
+        scopes = self.get_scopes()
+        failed_scopes = []
+        scope_threads = [ThreadedCall(None, self.update_scopes, scopes[index::self.max_concurrent_requests], failed_scopes) for index in range(min(len(scopes), self.max_concurrent_requests))]
+
+        for thread in scope_threads:
+            thread.start()
+
+        for thread in scope_threads + lookup_threads:
+            thread.wait()
+
+        if failed_scopes and len(failed_scopes) == len(scopes):
+            return
+
+        items = self.get_items()
+
+        if self.unknown_feeds and self.feeds_updated < now:
+            # New feeds might have been added to new folders
+            self.update_folders()
+            self.update_feeds()
+
+            items = self.get_items()
+
         self.ready.emit(items)
 
 
-class View(QtWidgets.QTreeWidget, AbstractView):
-    def __init__(self, nextcloud_url, username, password, columns=None, show_folders=None, hide_folders=None, item_options=None, context_menu_items=None, update_interval=600, update_in_background=False, tab_id_status=None):
+@functools.lru_cache(maxsize=4096)
+def format_timestamp(timestamp: int):
+    return datetime.datetime.fromtimestamp(timestamp).strftime("%c")
+
+
+class DateDelegate(QtWidgets.QStyledItemDelegate):
+    def displayText(self, value, locale):
+        # Dates are only formatted for visible rows
+        return format_timestamp(value)
+
+
+class NewsNode:
+    def __init__(self, item_type: str, key, count=0, entry: dict = None, feed_id: int = None):
+        self.item_type = item_type
+        self.key = key
+        self.count = count
+        self.entry = entry
+        self.feed_id = feed_id
+        self.parent: "NewsNode" = None
+        self.children: List["NewsNode"] = []
+        self.row = 0
+
+    def add_child(self, node: "NewsNode"):
+        node.parent = self
+        node.row = len(self.children)
+
+        self.children.append(node)
+
+    def get_group_nodes(self):
+        nodes = []
+
+        for child in self.children:
+            if child.entry is None:
+                nodes.append(child)
+                nodes.extend(child.get_group_nodes())
+
+        return nodes
+
+
+class NewsModel(QtCore.QAbstractItemModel):
+    headers = ["Title", "Date"]
+
+    def __init__(self, parent, feed_icon_cache: "FeedIconCache"):
+        super().__init__(parent)
+
+        self.root = NewsNode("root", None)
+        self.feed_icon_cache = feed_icon_cache
+
+        self.feed_icon_cache.icon_ready.connect(self.update_feed_icon)
+
+    def update_feed_icon(self, feed_id: int):
+        for folder_node in self.root.children:
+            for feed_node in folder_node.children:
+                if feed_node.feed_id == feed_id:
+                    self.dataChanged.emit(self.index_for_node(feed_node), self.index_for_node(feed_node), [QtCore.Qt.DecorationRole])
+
+    def get_node(self, index: QtCore.QModelIndex) -> NewsNode:
+        if index.isValid():
+            return index.internalPointer()
+
+        return self.root
+
+    def index_for_node(self, node: NewsNode, column=0):
+        if node is self.root:
+            return QtCore.QModelIndex()
+
+        return self.createIndex(node.row, column, node)
+
+    def index(self, row, column, parent=QtCore.QModelIndex()):
+        children = self.get_node(parent).children
+
+        if row < 0 or row >= len(children) or column < 0 or column >= len(self.headers):
+            return QtCore.QModelIndex()
+
+        return self.createIndex(row, column, children[row])
+
+    def parent(self, index: QtCore.QModelIndex):
+        if not index.isValid():
+            return QtCore.QModelIndex()
+
+        return self.index_for_node(index.internalPointer().parent)
+
+    def rowCount(self, parent=QtCore.QModelIndex()):
+        if parent.column() > 0:
+            return 0
+
+        return len(self.get_node(parent).children)
+
+    def columnCount(self, parent=QtCore.QModelIndex()):
+        return len(self.headers)
+
+    def headerData(self, section, orientation, role=QtCore.Qt.DisplayRole):
+        if orientation == QtCore.Qt.Horizontal and role == QtCore.Qt.DisplayRole:
+            return self.headers[section]
+
+        return None
+
+    def data(self, index: QtCore.QModelIndex, role=QtCore.Qt.DisplayRole):
+        if not index.isValid():
+            return None
+
+        node: NewsNode = index.internalPointer()
+
+        if node.entry is None:
+            if index.column() == 0 and role == QtCore.Qt.DisplayRole:
+                return "{} ({})".format(node.key, node.count)
+            elif index.column() == 0 and role == QtCore.Qt.DecorationRole and node.feed_id is not None:
+                return self.feed_icon_cache.get_icon(node.feed_id)
+
+            return None
+
+        if role == QtCore.Qt.UserRole:
+            return node.entry
+
+        if index.column() == 0:
+            if role in (QtCore.Qt.DisplayRole, QtCore.Qt.ToolTipRole):
+                return node.entry["title"]
+        else:
+            if role == QtCore.Qt.DisplayRole:
+                return node.entry["pubDate"]
+            elif role == QtCore.Qt.ToolTipRole:
+                return format_timestamp(node.entry["pubDate"])
+
+        return None
+
+    def update_node(self, node: NewsNode, new_node: NewsNode):
+        if node.entry is not None:
+            changed = node.entry["title"] != new_node.entry["title"] or node.entry["pubDate"] != new_node.entry["pubDate"]
+
+            node.entry = new_node.entry
+
+            if changed:
+                self.dataChanged.emit(self.index_for_node(node), self.index_for_node(node, len(self.headers) - 1))
+
+            return []
+
+        if node.count != new_node.count or node.feed_id != new_node.feed_id:
+            node.count = new_node.count
+            node.feed_id = new_node.feed_id
+            self.dataChanged.emit(self.index_for_node(node), self.index_for_node(node))
+
+        return self.update_children(node, new_node.children)
+
+    def update_children(self, parent_node: NewsNode, new_nodes: List[NewsNode]):
+        # Update the rows by their key (instead of resetting the model) to keep the selection, expanded state and scroll position
+        parent_index = self.index_for_node(parent_node)
+        children = parent_node.children
+        new_keys = {node.key for node in new_nodes}
+        inserted_nodes = []
+
+        row = len(children) - 1
+
+        while row >= 0:
+            if children[row].key in new_keys:
+                row -= 1
+                continue
+
+            last_row = row
+
+            while row >= 0 and children[row].key not in new_keys:
+                row -= 1
+
+            self.beginRemoveRows(parent_index, row + 1, last_row)
+            del children[row + 1:last_row + 1]
+            self.update_rows(children, row + 1)
+            self.endRemoveRows()
+
+        existing_nodes = {node.key: node for node in children}
+        pending_nodes = []
+        row = 0
+
+        def insert_pending_nodes():
+            nonlocal row, pending_nodes
+
+            if not pending_nodes:
+                return
+
+            self.beginInsertRows(parent_index, row, row + len(pending_nodes) - 1)
+
+            for pending_node in pending_nodes:
+                pending_node.parent = parent_node
+
+            children[row:row] = pending_nodes
+            self.update_rows(children, row)
+
+            self.endInsertRows()
+
+            for pending_node in pending_nodes:
+                if pending_node.entry is None:
+                    inserted_nodes.append(pending_node)
+                    inserted_nodes.extend(pending_node.get_group_nodes())
+
+            row += len(pending_nodes)
+            pending_nodes = []
+
+        for new_node in new_nodes:
+            node = existing_nodes.get(new_node.key)
+
+            if node is None:
+                pending_nodes.append(new_node)
+                continue
+
+            insert_pending_nodes()
+
+            if children[row] is not node:
+                # The order has changed (e.g. renamed feed), move the existing node
+                old_row = children.index(node, row)
+
+                self.beginMoveRows(parent_index, old_row, old_row, parent_index, row)
+                children.insert(row, children.pop(old_row))
+                self.update_rows(children, row, old_row + 1)
+                self.endMoveRows()
+
+            inserted_nodes.extend(self.update_node(node, new_node))
+            row += 1
+
+        insert_pending_nodes()
+
+        return inserted_nodes
+
+    @staticmethod
+    def update_rows(nodes: List[NewsNode], first_row: int, end_row: int = None):
+        # Rows have to be up to date right after each change as the view might ask for the parents of the moved rows
+        for row in range(first_row, len(nodes) if end_row is None else end_row):
+            nodes[row].row = row
+
+
+class BatchPlaceholders(dict):
+    def __init__(self, items: List[dict]):
+        super().__init__()
+
+        self.items = items
+
+    def __missing__(self, key):
+        # Placeholders are replaced by the values of all items, each quoted as separate shell argument
+        return " ".join(shlex.quote(str(item[key])) for item in self.items)
+
+
+class CommandRunner(QtCore.QObject):
+    command_done = QtCore.pyqtSignal(dict, list, object, str)
+
+    default_timeout = 60
+
+    def __init__(self, parent, max_concurrent: int):
+        super().__init__(parent)
+
+        self.max_concurrent = max_concurrent
+        self.queue = deque()
+        self.running = 0
+
+        self.command_done.connect(self.start_next)
+
+    def add(self, menu_item: dict, command: str, items: List[dict]):
+        self.queue.append((menu_item, command, items))
+        self.start_next()
+
+    def start_next(self, *finished_command):
+        if finished_command:
+            self.running -= 1
+
+        while self.queue and self.running < self.max_concurrent:
+            self.running += 1
+
+            thread = ThreadedCall(self, self.run_command, *self.queue.popleft())
+            thread.finished.connect(thread.deleteLater)
+            thread.start()
+
+    def run_command(self, menu_item: dict, command: str, items: List[dict]):
+        timeout = menu_item.get("timeout", self.default_timeout)
+
+        try:
+            # Use a new session to be able to kill the shell including all of its child processes
+            process = subprocess.Popen(command, shell=True, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, universal_newlines=True, start_new_session=True)
+
+            try:
+                output, _ = process.communicate(timeout=timeout)
+                exit_status = process.returncode
+            except subprocess.TimeoutExpired:
+                os.killpg(process.pid, signal.SIGKILL)
+                output, _ = process.communicate()
+                output = "{}Timeout after {} seconds".format(output, timeout)
+                exit_status = None
+        except:
+            traceback.print_exc()
+            output = traceback.format_exc(limit=0)
+            exit_status = None
+
+        self.command_done.emit(menu_item, items, exit_status, output)
+
+
+class FeedIconCache(QtCore.QObject):
+    icon_ready = QtCore.pyqtSignal(int)
+
+    instances = {}
+
+    # Check for changed icons once a day
+    max_age = 24 * 60 * 60
+    cleanup_age = 30 * 24 * 60 * 60
+
+    def __init__(self, base_url: str):
+        super().__init__()
+
+        self.cache_dir_name = "nextcloud_news/favicons/{}".format(hashlib.sha1(base_url.encode("utf-8")).hexdigest())
+        self.icons = {}
+        self.urls = {}
+        self.queued_urls = {}
+        self.downloads: List[ThreadedDownloadAndCache] = []
+        self.cleaned_up = False
+
+    @staticmethod
+    def get_instance(base_url: str):
+        # Shared by all views of the same account
+        if base_url not in FeedIconCache.instances:
+            FeedIconCache.instances[base_url] = FeedIconCache(base_url)
+
+        return FeedIconCache.instances[base_url]
+
+    def set_feeds(self, feeds: dict):
+        self.urls = {feed_id: feed.get("faviconLink") for feed_id, feed in feeds.items() if feed.get("faviconLink")}
+
+    def get_icon(self, feed_id: int):
+        if feed_id in self.icons:
+            return self.icons[feed_id]
+
+        url = self.urls.get(feed_id)
+
+        if url is None:
+            return None
+
+        path = os.path.join(get_cache_path(self.cache_dir_name), str(feed_id))
+
+        if os.path.exists(path):
+            self.icons[feed_id] = QtGui.QIcon(path)
+
+            if time.time() - os.path.getmtime(path) < self.max_age:
+                return self.icons[feed_id]
+        else:
+            # Do not try again until the download has finished
+            self.icons[feed_id] = None
+
+        self.queue_download(feed_id, url)
+
+        return self.icons[feed_id]
+
+    def queue_download(self, feed_id: int, url: str):
+        # Collect the icons requested while painting to download them at once
+        if not self.queued_urls:
+            QtCore.QTimer.singleShot(0, self.start_download)
+
+        self.queued_urls[str(feed_id)] = url
+
+    def start_download(self):
+        urls = self.queued_urls
+        self.queued_urls = {}
+
+        self.downloads = [download for download in self.downloads if download.isRunning()]
+
+        # Only the first download cleans up the cache, concurrent cleanups would remove the same files
+        if self.cleaned_up:
+            download = ThreadedDownloadAndCache(self.cache_dir_name, urls, max_age=self.max_age)
+        else:
+            download = ThreadedDownloadAndCache(self.cache_dir_name, urls, max_age=self.max_age, cleanup_age=self.cleanup_age)
+            self.cleaned_up = True
+
+        download.file_done.connect(self.download_done)
+        download.start()
+
+        self.downloads.append(download)
+
+    def download_done(self, name: str, path: str, count: int, total: int):
+        self.icons[int(name)] = QtGui.QIcon(path)
+        self.icon_ready.emit(int(name))
+
+
+class ImageCache(QtCore.QObject):
+    images_ready = QtCore.pyqtSignal()
+
+    cache_dir_name = "nextcloud_news/images"
+
+    # Images not used for a while or exceeding the size limit are removed once in a while when downloading images
+    cleanup_age = 7 * 24 * 60 * 60
+    cleanup_size = 100 * 1024 * 1024
+    cleanup_interval = 60 * 60
+
+    # Failed images (e.g. not found or blocked tracking pixels) are not requested again for some time
+    retry_failed_after = 60 * 60
+
+    def __init__(self, parent):
+        super().__init__(parent)
+
+        self.paths = {}
+        self.pending_urls = set()
+        self.failed_urls = {}
+        self.queued_urls = {}
+        self.download: ThreadedDownloadAndCache = None
+        self.downloading = False
+        self.last_cleanup = None
+
+    @staticmethod
+    def get_name(url: str):
+        return hashlib.sha1(url.encode("utf-8")).hexdigest()
+
+    def is_failed(self, url: str):
+        failed_time = self.failed_urls.get(url)
+
+        if failed_time is None:
+            return False
+
+        if time.time() - failed_time >= self.retry_failed_after:
+            del self.failed_urls[url]
+            return False
+
+        return True
+
+    def set_failed(self, url: str):
+        self.paths.pop(url, None)
+        self.failed_urls[url] = time.time()
+
+    def remove_path(self, url: str):
+        self.paths.pop(url, None)
+
+    def get_path(self, url: str):
+        if url not in self.paths:
+            path = os.path.join(get_cache_path(self.cache_dir_name), self.get_name(url))
+
+            if not os.path.exists(path):
+                return None
+
+            self.paths[url] = path
+
+        return self.paths[url]
+
+    def prefetch(self, urls):
+        urls = {self.get_name(url): url for url in urls if url not in self.pending_urls and not self.is_failed(url) and self.get_path(url) is None}
+
+        if not urls:
+            return
+
+        # Collect the images requested while rendering an item to download them at once
+        if not self.queued_urls and not self.downloading:
+            QtCore.QTimer.singleShot(0, self.start_download)
+
+        self.pending_urls.update(urls.values())
+        self.queued_urls.update(urls)
+
+    def start_download(self):
+        # Only a single download at a time, images requested in the meantime are downloaded afterwards
+        if self.downloading or not self.queued_urls:
+            return
+
+        urls = self.queued_urls
+        self.queued_urls = {}
+
+        # The previous thread emits finished right before returning from run
+        if self.download is not None:
+            self.download.wait()
+
+        if self.last_cleanup is None or time.time() - self.last_cleanup >= self.cleanup_interval:
+            self.last_cleanup = time.time()
+            self.download = ThreadedDownloadAndCache(self.cache_dir_name, urls, cleanup_age=self.cleanup_age, cleanup_size=self.cleanup_size)
+        else:
+            self.download = ThreadedDownloadAndCache(self.cache_dir_name, urls)
+
+        self.download.file_done.connect(lambda name, path, count, total: self.paths.update({urls[name]: path}))
+        self.download.finished.connect(lambda: self.download_done(urls))
+        self.download.start()
+
+        self.downloading = True
+
+    def download_done(self, urls: dict):
+        self.downloading = False
+        self.pending_urls.difference_update(urls.values())
+
+        now = time.time()
+
+        for url in urls.values():
+            if url not in self.paths:
+                self.failed_urls[url] = now
+
+        self.images_ready.emit()
+
+        self.start_download()
+
+
+class ReaderWidget(QtWidgets.QTextBrowser):
+    image_regex = re.compile(r"<img[^>]+src=[\"']([^\"']+)[\"']", re.IGNORECASE)
+
+    def __init__(self, image_cache: ImageCache):
+        super().__init__()
+
+        self.image_cache = image_cache
+        self.item = None
+        self.missing_urls = set()
+
+        self.setOpenExternalLinks(True)
+
+        self.image_cache.images_ready.connect(self.reload_images)
+
+    @staticmethod
+    def get_image_urls(item: dict):
+        base_url = QtCore.QUrl(item.get("url") or "")
+
+        return [base_url.resolved(QtCore.QUrl(src)).toString() for src in ReaderWidget.image_regex.findall(item.get("body") or "")]
+
+    def show_item(self, item: dict):
+        previous_item = self.item
+        self.item = item
+
+        if item is None:
+            self.clear()
+            return
+
+        scroll_value = self.verticalScrollBar().value()
+
+        self.missing_urls = set()
+        self.document().setBaseUrl(QtCore.QUrl(item.get("url") or ""))
+        self.setHtml("<h2>{}</h2>{}".format(html.escape(item["title"]), item.get("body") or ""))
+
+        # Keep the position while reloading the same item once its images are available
+        if item is previous_item:
+            self.verticalScrollBar().setValue(scroll_value)
+
+    def reload_images(self):
+        if self.item is None or not self.missing_urls:
+            return
+
+        # Wait until all images of the item have been downloaded
+        if any(url in self.image_cache.pending_urls for url in self.get_image_urls(self.item)):
+            return
+
+        # Only reload if at least one of the missing images actually arrived
+        if all(self.image_cache.get_path(url) is None for url in self.missing_urls):
+            return
+
+        self.show_item(self.item)
+
+    def loadResource(self, resource_type, url: QtCore.QUrl):
+        if resource_type == QtGui.QTextDocument.ImageResource and url.scheme() in ("http", "https"):
+            # Images are only loaded from the cache, missing ones are downloaded in background
+            image_url = url.toString()
+            path = self.image_cache.get_path(image_url)
+
+            if path is not None:
+                image = QtGui.QImage(path)
+
+                if not image.isNull():
+                    return image
+
+                if os.path.exists(path):
+                    # Not a supported image format
+                    self.image_cache.set_failed(image_url)
+                else:
+                    # Removed by the cache cleanup in the meantime
+                    self.image_cache.remove_path(image_url)
+
+            if not self.image_cache.is_failed(image_url):
+                self.missing_urls.add(image_url)
+                self.image_cache.prefetch([image_url])
+
+            return None
+
+        return super().loadResource(resource_type, url)
+
+
+class View(QtWidgets.QWidget, AbstractView):
+    mark_as_read_done = QtCore.pyqtSignal(list, bool)
+
+    # Number of following items whose images are downloaded in advance while reading
+    prefetch_count = 3
+
+    def __init__(self, nextcloud_url, username, password, columns=None, show_folders=None, hide_folders=None, item_options=None, context_menu_items=None, update_interval=600, update_in_background=False, tab_id_status=None, show_reader=False, max_concurrent_commands=4, max_items=None):
         super().__init__()
 
         self.news = {}
@@ -74,47 +1130,107 @@ class View(QtWidgets.QTreeWidget, AbstractView):
         self.auth = (username, password)
         self.show_folders = show_folders
         self.hide_folders = hide_folders
-        self.item_options = item_options
+        self.item_options = ItemOptions(item_options)
         self.context_menu_items = context_menu_items
         self.tab_id_status = tab_id_status
+        self.update_in_background = update_in_background
         self.seen_items = set()
+        self.polled_unread_count = None
+        self.new_item_count = 0
+        self.sync_pending = False
+        self.items = []
+        self.queued_read_ids = []
+        self.pending_read_ids = set()
 
         self.new_items_icon = QtGui.QIcon(os.path.join(os.path.dirname(os.path.realpath(__file__)), "images", "new_items.png"))
 
-        self.setAlternatingRowColors(True)
-        self.setSelectionMode(QtWidgets.QAbstractItemView.ExtendedSelection)
-        self.setEditTriggers(QtWidgets.QAbstractItemView.NoEditTriggers)
-        self.setRootIsDecorated(False)
-        self.doubleClicked.connect(self.open_selected_items)
+        store_name = hashlib.sha1("{}|{}".format(self.base_url, username).encode("utf-8")).hexdigest()
+        self.item_store = ItemStore(os.path.join(get_cache_path("nextcloud_news"), "{}.sqlite".format(store_name)))
+
+        layout = QtWidgets.QVBoxLayout()
+        layout.setContentsMargins(0, 0, 0, 0)
+        self.setLayout(layout)
+
+        self.search_field = QtWidgets.QLineEdit()
+        self.search_field.setPlaceholderText("Search")
+        self.search_field.setClearButtonEnabled(True)
+        layout.addWidget(self.search_field)
 
-        self.setHeaderLabels(["Title", "Date"])
+        splitter = QtWidgets.QSplitter()
+        layout.addWidget(splitter)
 
-        self.setColumnWidth(1, 250)
+        self.tree_view = QtWidgets.QTreeView()
+        splitter.addWidget(self.tree_view)
 
-        self.header().setStretchLastSection(False)
-        self.header().setSectionResizeMode(0, QtWidgets.QHeaderView.Stretch)
+        self.image_cache = ImageCache(self)
+
+        self.reader_widget = ReaderWidget(self.image_cache)
+        self.reader_widget.setVisible(show_reader)
+        splitter.addWidget(self.reader_widget)
+
+        self.command_status_label = QtWidgets.QLabel()
+        self.command_status_label.setWordWrap(True)
+        self.command_status_label.setStyleSheet("color: red")
+        self.command_status_label.hide()
+        layout.addWidget(self.command_status_label)
+
+        self.command_status_timer = QtCore.QTimer(self)
+        self.command_status_timer.setSingleShot(True)
+        self.command_status_timer.setInterval(15000)
+        self.command_status_timer.timeout.connect(self.command_status_label.hide)
+
+        self.command_runner = CommandRunner(self, max_concurrent_commands)
+        self.command_runner.command_done.connect(self.command_done)
+
+        self.tree_view.setAlternatingRowColors(True)
+        self.tree_view.setSelectionMode(QtWidgets.QAbstractItemView.ExtendedSelection)
+        self.tree_view.setEditTriggers(QtWidgets.QAbstractItemView.NoEditTriggers)
+        self.tree_view.setRootIsDecorated(False)
+        self.tree_view.setUniformRowHeights(True)
+        self.tree_view.doubleClicked.connect(self.open_selected_items)
+
+        self.feed_icon_cache = FeedIconCache.get_instance(self.base_url)
+
+        self.news_model = NewsModel(self, self.feed_icon_cache)
+        self.tree_view.setModel(self.news_model)
+
+        if show_reader:
+            self.tree_view.selectionModel().currentChanged.connect(self.show_current_item)
+        self.tree_view.setItemDelegateForColumn(1, DateDelegate(self))
+
+        self.tree_view.setColumnWidth(1, 250)
+
+        self.tree_view.header().setStretchLastSection(False)
+        self.tree_view.header().setSectionResizeMode(0, QtWidgets.QHeaderView.Stretch)
 
         if columns:
-            self.setColumnHidden(0, "title" not in columns)
-            self.setColumnHidden(1, "date" not in columns)
+            self.tree_view.setColumnHidden(0, "title" not in columns)
+            self.tree_view.setColumnHidden(1, "date" not in columns)
+
+        # Search while typing, but not on every key press
+        self.search_timer = QtCore.QTimer(self)
+        self.search_timer.setSingleShot(True)
+        self.search_timer.setInterval(300)
+        self.search_timer.timeout.connect(lambda: self.update_data(self.items))
+        self.search_field.textChanged.connect(self.search_timer.start)
 
         open_action = QtWidgets.QAction(QtGui.QIcon.fromTheme("document-open"), "Open", self)
         open_action.setShortcut(QtGui.QKeySequence(QtCore.Qt.Key.Key_Return))
         open_action.setShortcutContext(QtCore.Qt.WidgetShortcut)
         open_action.triggered.connect(self.open_selected_items)
-        self.addAction(open_action)
+        self.tree_view.addAction(open_action)
 
         copy_action = QtWidgets.QAction(QtGui.QIcon.fromTheme("edit-copy"), "Copy URL", self)
         copy_action.setShortcut(QtGui.QKeySequence(QtGui.QKeySequence.StandardKey.Copy))
         copy_action.setShortcutContext(QtCore.Qt.WidgetShortcut)
         copy_action.triggered.connect(self.copy_selected_items)
-        self.addAction(copy_action)
+        self.tree_view.addAction(copy_action)
 
         mark_as_read_action = QtWidgets.QAction(QtGui.QIcon.fromTheme("mail-mark-read"), "Mark as read", self)
         mark_as_read_action.setShortcut(QtGui.QKeySequence(QtGui.QKeySequence.StandardKey.Delete))
         mark_as_read_action.setShortcutContext(QtCore.Qt.WidgetShortcut)
         mark_as_read_action.triggered.connect(self.mark_selected_item_as_read)
-        self.addAction(mark_as_read_action)
+        self.tree_view.addAction(mark_as_read_action)
 
         self.context_menu = QtWidgets.QMenu()
         self.context_menu.addAction(open_action)
@@ -127,13 +1243,31 @@ class View(QtWidgets.QTreeWidget, AbstractView):
 
             self.add_context_menu_items()
 
-        self.setContextMenuPolicy(QtCore.Qt.CustomContextMenu)
-        self.customContextMenuRequested.connect(self.show_context_menu)
+        self.tree_view.setContextMenuPolicy(QtCore.Qt.CustomContextMenu)
+        self.tree_view.customContextMenuRequested.connect(self.show_context_menu)
 
         self.visibility_changed.connect(self.on_visibility_changed)
 
-        self.updater_thread = Updater(self.base_url, self.auth)
-        self.updater_thread.ready.connect(self.update_data)
+        self.updater_thread = Updater(self.base_url, self.auth, self.item_store, show_folders, hide_folders, max_items)
+        self.updater_thread.ready.connect(self.items_ready)
+        self.updater_thread.unread_count_ready.connect(self.unread_count_ready)
+
+        if update_in_background:
+            # The unread counts of the feeds are used to detect new items, therefore keep them current on every full update
+            self.updater_thread.feeds_max_age = 0
+
+        # Collect items marked as read within a short time to send them using a single request
+        self.mark_as_read_timer = QtCore.QTimer(self)
+        self.mark_as_read_timer.setSingleShot(True)
+        self.mark_as_read_timer.setInterval(500)
+        self.mark_as_read_timer.timeout.connect(self.send_queued_read_ids)
+
+        self.mark_as_read_done.connect(self.on_mark_as_read_done)
+
+        self.refresh_timer = QtCore.QTimer(self)
+        self.refresh_timer.setSingleShot(True)
+        self.refresh_timer.setInterval(2000)
+        self.refresh_timer.timeout.connect(self.updater_thread.start)
 
         timer = Timer(self, update_interval * 1000, self, auto_enable=not update_in_background)
         timer.timeout.connect(self.trigger_update_by_timer)
@@ -141,18 +1275,65 @@ class View(QtWidgets.QTreeWidget, AbstractView):
         if update_in_background:
             timer.start()
 
+    def start_view(self):
+        # Show the items of the last session until the update has finished
+        self.update_data(self.updater_thread.get_items())
+        self.polled_unread_count = self.updater_thread.get_unread_count()
+
+    def get_search_ids(self):
+        text = self.search_field.text().strip()
+
+        if not text:
+            return None
+
+        try:
+            return self.item_store.search(text)
+        except sqlite3.Error:
+            traceback.print_exc()
+            return None
+
     def on_visibility_changed(self, state: bool):
         if state:
             self.seen_items = set(self.news)
 
+            # The full update has been deferred while in background
+            if self.sync_pending:
+                self.updater_thread.start()
+
         self.update_tab()
 
     def trigger_update_by_timer(self):
         if len(self.get_selected_items()) > 1:
             return
 
+        if self.update_in_background and not is_visible(self):
+            # Only check for new items while not visible, the items are fetched once the view becomes visible
+            thread = ThreadedCall(self, self.updater_thread.poll_unread_count)
+            thread.finished.connect(thread.deleteLater)
+            thread.start()
+            return
+
         self.updater_thread.start()
 
+    def items_ready(self, items):
+        self.polled_unread_count = self.updater_thread.get_unread_count()
+        self.new_item_count = 0
+        self.sync_pending = False
+
+        self.update_data(items)
+
+    def unread_count_ready(self, unread_count: int):
+        # Compare with the count of the last full update as the count also includes excluded items
+        if self.polled_unread_count is None:
+            return
+
+        self.new_item_count = max(0, unread_count - self.polled_unread_count)
+
+        if self.new_item_count:
+            self.sync_pending = True
+
+        self.update_tab()
+
     def add_context_menu_item(self, menu_item):
         if menu_item.get("type") == "separator":
             self.context_menu.addSeparator()
@@ -170,7 +1351,7 @@ class View(QtWidgets.QTreeWidget, AbstractView):
             action.setShortcutContext(QtCore.Qt.WidgetShortcut)
 
         action.triggered.connect(lambda: self.execute_context_menu_action(menu_item))
-        self.addAction(action)
+        self.tree_view.addAction(action)
         self.context_menu.addAction(action)
 
     def add_context_menu_items(self):
@@ -186,53 +1367,83 @@ class View(QtWidgets.QTreeWidget, AbstractView):
         if not items:
             return
 
-        for list_item in items:
-            ThreadedCall(self, self.execute_context_menu_action_for_item, menu_item, list_item).start()
+        command = menu_item.get("command")
 
-        self.updater_thread.start()
+        if command is None:
+            if menu_item.get("mark_as_read"):
+                self.mark_items_as_read(items)
 
-    def execute_context_menu_action_for_item(self, menu_item, list_item):
-        command = menu_item.get("command")
-        if command is not None:
-            subprocess.check_call(command.format_map(list_item), shell=True)
+            return
 
-        if menu_item.get("mark_as_read"):
-            self.mark_item_as_read(list_item)
+        items = self.add_bodies(items)
 
-    def show_context_menu(self, position):
-        if not self.itemAt(position):
+        try:
+            if menu_item.get("batch"):
+                commands = [(command.format_map(BatchPlaceholders(items)), items)]
+            else:
+                commands = [(command.format_map(list_item), [list_item]) for list_item in items]
+        except (KeyError, ValueError) as exception:
+            self.show_command_status("Invalid command for '{}': {}".format(menu_item.get("title"), exception))
             return
 
-        self.context_menu.exec(self.mapToGlobal(position))
+        for formatted_command, command_items in commands:
+            self.command_runner.add(menu_item, formatted_command, command_items)
 
-    def check_item_options(self, item_type: str, value: str, action: ItemAction):
-        if not self.item_options:
-            return False
+    def command_done(self, menu_item, items, exit_status, output):
+        if exit_status == 0:
+            if menu_item.get("mark_as_read"):
+                self.mark_items_as_read(items)
 
-        for item in self.item_options:
-            if item["type"] != item_type:
-                continue
+            return
 
-            if "value" in item:
-                if item["value"] == value and item["action"] == action.value:
-                    return True
-            elif "regex" in item and item["action"] == action.value:
-                if re.match(item["regex"], value):
-                    return True
+        if exit_status is None:
+            message = "Command '{}' failed".format(menu_item.get("title"))
+        else:
+            message = "Command '{}' failed with exit status {}".format(menu_item.get("title"), exit_status)
+
+        output = output.strip()
+
+        if output:
+            message = "{}: {}".format(message, output.splitlines()[-1])
+
+        self.show_command_status(message, output)
+
+    def show_command_status(self, message: str, details: str = None):
+        self.command_status_label.setText(message)
+        self.command_status_label.setToolTip(details or message)
+        self.command_status_label.show()
+        self.command_status_timer.start()
+
+    def show_context_menu(self, position):
+        if not self.tree_view.indexAt(position).isValid():
+            return
+
+        self.context_menu.exec(self.tree_view.mapToGlobal(position))
+
+    def check_item_options(self, item_type: str, value: str, action: ItemAction):
+        # Folder and feed names are limited, therefore their verdicts are cached
+        if item_type == "entry":
+            return self.item_options.check(item_type, value, action)
 
-        return False
+        return self.item_options.check_cached(item_type, value, action)
 
     def update_data(self, items):
-        self.clear()
+        self.items = items
 
         self.news = {}
 
+        search_ids = self.get_search_ids()
+
         grouped_items = {}
 
         for entry in items:
             folder = entry["folder"]
             feed = entry["feed"]
 
+            # Already marked as read but not yet confirmed by the server
+            if entry["id"] in self.pending_read_ids:
+                continue
+
             if self.show_folders and folder not in self.show_folders:
                 continue
 
@@ -241,6 +1452,9 @@ class View(QtWidgets.QTreeWidget, AbstractView):
 
             self.news[entry["id"]] = entry
 
+            if search_ids is not None and entry["id"] not in search_ids:
+                continue
+
             if folder not in grouped_items:
                 grouped_items[folder] = {}
 
@@ -251,14 +1465,15 @@ class View(QtWidgets.QTreeWidget, AbstractView):
 
         sorted_folders = OrderedDict(sorted(grouped_items.items(), key=lambda item: item[0].lower()))
 
+        self.feed_icon_cache.set_feeds(self.updater_thread.feeds)
+
+        folder_nodes = []
+
         for folder_name, feeds in sorted_folders.items():
             if self.check_item_options("folder", folder_name, ItemAction.EXCLUDE):
                 continue
 
-            folder_item = QtWidgets.QTreeWidgetItem(self)
-
-            folder_item.setText(0, "{} ({})".format(folder_name, sum([len(entries) for entries in feeds.values()])))
-            folder_item.setExpanded(not self.check_item_options("folder", folder_name, ItemAction.COLLAPSE))
+            folder_node = NewsNode("folder", folder_name, sum([len(entries) for entries in feeds.values()]))
 
             sorted_feeds = OrderedDict(sorted(feeds.items(), key=lambda item: item[0].lower()))
 
@@ -266,25 +1481,20 @@ class View(QtWidgets.QTreeWidget, AbstractView):
                 if self.check_item_options("feed", feed_name, ItemAction.EXCLUDE):
                     continue
 
-                feed_item = QtWidgets.QTreeWidgetItem(folder_item)
-
-                feed_item.setText(0, "{} ({})".format(feed_name, len(entries)))
-                feed_item.setExpanded(not self.check_item_options("feed", feed_name, ItemAction.COLLAPSE))
+                feed_node = NewsNode("feed", feed_name, len(entries), feed_id=int(entries[0]["feedId"]))
 
                 for entry in entries:
                     if self.check_item_options("entry", entry["title"], ItemAction.EXCLUDE):
                         continue
 
-                    entry_item = QtWidgets.QTreeWidgetItem(feed_item)
+                    feed_node.add_child(NewsNode("entry", entry["id"], entry=entry))
 
-                    datetime_string = datetime.datetime.fromtimestamp(entry["pubDate"]).strftime("%c")
+                folder_node.add_child(feed_node)
 
-                    entry_item.setData(0, QtCore.Qt.UserRole, entry)
+            folder_nodes.append(folder_node)
 
-                    entry_item.setText(0, entry["title"])
-                    entry_item.setData(0, QtCore.Qt.ToolTipRole, entry["title"])
-                    entry_item.setText(1, datetime_string)
-                    entry_item.setData(1, QtCore.Qt.ToolTipRole, datetime_string)
+        for node in self.news_model.update_children(self.news_model.root, folder_nodes):
+            self.tree_view.setExpanded(self.news_model.index_for_node(node), not self.check_item_options(node.item_type, node.key, ItemAction.COLLAPSE))
 
         if self.isVisible():
             self.seen_items = set(self.news.keys())
@@ -300,9 +1510,9 @@ class View(QtWidgets.QTreeWidget, AbstractView):
 
         tab_widget, tab_index = get_dashboard_instance().tab_by_id(self.tab_id_status)
         if tab_widget is not None:
-            unseen_items = self.get_unseen_items()
-            if unseen_items:
-                tab_title = " ({})".format(len(unseen_items))
+            unseen_count = len(self.get_unseen_items()) + self.new_item_count
+            if unseen_count:
+                tab_title = " ({})".format(unseen_count)
                 tab_icon = self.new_items_icon
             else:
                 tab_title = None
@@ -312,7 +1522,7 @@ class View(QtWidgets.QTreeWidget, AbstractView):
             tab_widget.setTabIcon(tab_index, tab_icon)
 
     def get_selected_items(self):
-        selected_model_indexes = self.selectedIndexes()
+        selected_model_indexes = self.tree_view.selectedIndexes()
 
         item_ids = set()
 
@@ -338,11 +1548,49 @@ class View(QtWidgets.QTreeWidget, AbstractView):
             return
 
         for item in items:
-            subprocess.run(["xdg-open", item["url"]])
+            QtCore.QProcess.startDetached("xdg-open", [item["url"]])
 
-            self.mark_item_as_read(item)
+        self.mark_items_as_read(items)
 
-        self.updater_thread.start()
+    def show_current_item(self, model_index: QtCore.QModelIndex):
+        entry = model_index.siblingAtColumn(0).data(QtCore.Qt.UserRole)
+
+        if not entry:
+            self.reader_widget.show_item(None)
+            return
+
+        # Download the images of the next items to allow paging through them without waiting
+        entries = [entry]
+        next_index = self.tree_view.indexBelow(model_index.siblingAtColumn(0))
+
+        while next_index.isValid() and len(entries) <= self.prefetch_count:
+            next_entry = next_index.data(QtCore.Qt.UserRole)
+
+            if next_entry:
+                entries.append(next_entry)
+
+            next_index = self.tree_view.indexBelow(next_index)
+
+        entries = self.add_bodies(entries)
+
+        self.reader_widget.show_item(entries[0])
+
+        image_urls = []
+
+        for list_item in entries:
+            image_urls.extend(ReaderWidget.get_image_urls(list_item))
+
+        self.image_cache.prefetch(image_urls)
+
+    def add_bodies(self, items):
+        # Bodies are not kept in memory but loaded from the store
+        try:
+            bodies = self.item_store.get_bodies([int(item["id"]) for item in items])
+        except sqlite3.Error:
+            traceback.print_exc()
+            bodies = {}
+
+        return [dict(item, body=bodies.get(int(item["id"]))) for item in items]
 
     def copy_selected_items(self):
         items = self.get_selected_items()
@@ -360,10 +1608,50 @@ class View(QtWidgets.QTreeWidget, AbstractView):
         if not items:
             return
 
-        for item in items:
-            self.mark_item_as_read(item)
+        self.mark_items_as_read(items)
 
-        self.updater_thread.start()
+    def mark_items_as_read(self, items):
+        item_ids = [item["id"] for item in items if item["id"] not in self.pending_read_ids]
+
+        if not item_ids:
+            return
+
+        self.queued_read_ids.extend(item_ids)
+        self.pending_read_ids.update(item_ids)
+        self.mark_as_read_timer.start()
+
+        # Remove the items immediately instead of waiting for the server
+        self.update_data(self.items)
+
+    def send_queued_read_ids(self):
+        item_ids = self.queued_read_ids
+        self.queued_read_ids = []
+
+        thread = ThreadedCall(self, self.send_mark_as_read, item_ids)
+        thread.finished.connect(thread.deleteLater)
+        thread.start()
+
+    def send_mark_as_read(self, item_ids):
+        try:
+            response = self.updater_thread.get_session().put("{}/items/read/multiple".format(self.base_url), json={"items": item_ids})
+            response.raise_for_status()
+            success = True
+        except:
+            traceback.print_exc()
+            success = False
+
+        self.mark_as_read_done.emit(item_ids, success)
+
+    def on_mark_as_read_done(self, item_ids, success):
+        self.pending_read_ids.difference_update(item_ids)
+
+        if success:
+            read_ids = set(item_ids)
+
+            self.updater_thread.remove_items(item_ids)
+            self.items = [item for item in self.items if item["id"] not in read_ids]
+        else:
+            # Show the items again
+            self.update_data(self.items)
 
-    def mark_item_as_read(self, item):
-        requests.put("{}/items/{}/read".format(self.base_url, item["id"]), auth=self.auth)
+        self.refresh_timer.start()
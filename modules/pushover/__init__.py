@@ -1,54 +1,164 @@
 import datetime
 import json
 import os
-import threading
-import time
+import random
+import sys
+from collections import OrderedDict
 
 import requests
-import websocket
-from PyQt5 import QtWidgets, QtCore, QtGui
+from PyQt5 import QtWidgets, QtCore, QtGui, QtWebSockets
 
-from lib.common import AbstractView, ThreadedRequest, ThreadedDownloadAndCache, get_cache_path, RingBuffer, get_dashboard_instance
+from lib.common import AbstractView, ThreadedRequest, ThreadedDownloadAndCache, get_cache_path, get_dashboard_instance
 
 
 class WebSocketHandler(QtCore.QObject):
     sync = QtCore.pyqtSignal()
 
+    url = "wss://client.pushover.net/push"
+
+    min_reconnect_delay = 1000
+    max_reconnect_delay = 5 * 60 * 1000
+
+    # Pushover sends a keep-alive message every 30 seconds, missing ones indicate a stale connection
+    ping_interval = 30 * 1000
+    stale_timeout = 90 * 1000
+
     def __init__(self, parent, secret, device_id):
         super().__init__(parent)
 
         self.secret = secret
         self.device_id = device_id
-        self.client = None
+        self.stopped = True
+        self.failed_attempts = 0
+
+        self.client = QtWebSockets.QWebSocket(parent=self)
+        self.client.connected.connect(self.on_open)
+        self.client.disconnected.connect(self.on_close)
+        self.client.error.connect(lambda error: self.on_close())
+        self.client.binaryMessageReceived.connect(self.on_message)
+        self.client.textMessageReceived.connect(lambda message: self.on_message(message.encode("utf-8")))
+        self.client.pong.connect(lambda elapsed_time, payload: self.stale_timer.start())
+
+        self.reconnect_timer = QtCore.QTimer(self)
+        self.reconnect_timer.setSingleShot(True)
+        self.reconnect_timer.timeout.connect(self.open)
+
+        self.ping_timer = QtCore.QTimer(self)
+        self.ping_timer.setInterval(self.ping_interval)
+        self.ping_timer.timeout.connect(lambda: self.client.ping())
+
+        self.stale_timer = QtCore.QTimer(self)
+        self.stale_timer.setSingleShot(True)
+        self.stale_timer.setInterval(self.stale_timeout)
+        self.stale_timer.timeout.connect(self.on_stale)
+
+    def connect(self):
+        self.stopped = False
+        self.open()
+
+    def open(self):
+        if self.stopped:
+            return
 
-    def connect(self, is_reconnect=False):
-        self.client = websocket.WebSocketApp("wss://client.pushover.net/push")
+        # Also used as timeout for establishing the connection
+        self.stale_timer.start()
 
-        self.client.on_open = lambda ws: self.on_open()
-        self.client.on_close = lambda ws: self.on_close()
-        self.client.on_message = lambda ws, message: self.on_message(message)
+        self.client.open(QtCore.QUrl(self.url))
 
-        thread = threading.Thread(target=lambda: self.thread_method(is_reconnect))
-        thread.daemon = True
-        thread.start()
+    def stop(self):
+        self.stopped = True
 
-    def thread_method(self, is_reconnect):
-        if is_reconnect:
-            time.sleep(10)
+        self.reconnect_timer.stop()
+        self.ping_timer.stop()
+        self.stale_timer.stop()
 
-        self.client.run_forever()
+        self.client.close()
 
     def on_open(self):
-        self.client.send("login:{}:{}\n".format(self.device_id, self.secret))
+        self.client.sendTextMessage("login:{}:{}\n".format(self.device_id, self.secret))
+
+        self.ping_timer.start()
+        self.stale_timer.start()
+
+        # Fetch messages which might have been missed while not connected
+        self.sync.emit()
 
     def on_close(self):
-        self.connect()
+        self.ping_timer.stop()
+        self.stale_timer.stop()
+
+        # Disconnects might be reported multiple times (e.g. error followed by disconnected)
+        if self.stopped or self.reconnect_timer.isActive():
+            return
+
+        # Exponential backoff with jitter to not hammer the server after an outage
+        delay = min(self.min_reconnect_delay * 2 ** self.failed_attempts, self.max_reconnect_delay)
+        delay = random.randint(delay // 2, delay)
 
-    def on_message(self, message):
+        self.failed_attempts += 1
+
+        self.reconnect_timer.start(delay)
+
+    def on_stale(self):
+        self.client.abort()
+
+        # Aborting a pending connection attempt does not emit disconnected
+        self.on_close()
+
+    def on_message(self, message: bytes):
         message = message.decode("utf-8")
 
+        self.stale_timer.start()
+        self.failed_attempts = 0
+
+        if not message:
+            return
+
         if message[0] == "!":
             self.sync.emit()
+        elif message[0] == "R":
+            # Server requests to reconnect
+            self.client.close()
+        elif message[0] in ("E", "A"):
+            # Permanent error or logged in from another session -> do not reconnect
+            print("Pushover websocket closed by server ({})".format(message[0]), file=sys.stderr)
+            self.stop()
+
+
+class MessageHistory:
+    # Only the fields required for rendering the list are kept
+    fields = ("id", "icon", "title", "app", "message", "date")
+
+    def __init__(self, size):
+        self.size = size
+        self.messages = OrderedDict()
+
+    def __len__(self):
+        return len(self.messages)
+
+    def __iter__(self):
+        return iter(self.messages.values())
+
+    def __reversed__(self):
+        return reversed(self.messages.values())
+
+    def add_messages(self, messages):
+        # Messages must be sorted by id, older messages exceeding the size would be evicted anyway
+        added_messages = []
+
+        for message in messages[-self.size:]:
+            message_id = message["id"]
+
+            if message_id in self.messages:
+                continue
+
+            self.messages[message_id] = {field: message[field] for field in self.fields if field in message}
+            added_messages.append(message)
+
+            if len(self.messages) > self.size:
+                self.messages.popitem(last=False)
+
+        return added_messages
 
 
 class ListWidget(QtWidgets.QTreeView):
@@ -113,7 +223,7 @@ class ListWidget(QtWidgets.QTreeView):
 
 
 class View(QtWidgets.QWidget, AbstractView):
-    def __init__(self, secret, device_id, tab_id_status=None):
+    def __init__(self, secret, device_id, tab_id_status=None, history_size=100):
         super().__init__()
 
         self.secret = secret
@@ -121,6 +231,7 @@ class View(QtWidgets.QWidget, AbstractView):
         self.tab_id_status = tab_id_status
         self.download_thread = None
         self.unseen_messages = 0
+        self.websocket_handler = None
 
         self.new_messages_icon = QtGui.QIcon(os.path.join(os.path.dirname(os.path.realpath(__file__)), "images", "new_messages.png"))
 
@@ -131,7 +242,7 @@ class View(QtWidgets.QWidget, AbstractView):
 
         self.setLayout(layout)
 
-        self.messages = RingBuffer(100)
+        self.messages = MessageHistory(history_size)
         self.messages_cache_file = get_cache_path("pushover/messages.json")
 
         self.update_thread = ThreadedRequest("get", "https://api.pushover.net/1/messages.json", params={"secret": self.secret, "device_id": self.device_id})
@@ -145,10 +256,7 @@ class View(QtWidgets.QWidget, AbstractView):
                 if self.isVisible():
                     self.unseen_messages = 0
 
-                loaded_messages = sorted(loaded_data["messages"], key=lambda item: item["id"])
-
-                for message in loaded_messages:
-                    self.add_message(message)
+                self.messages.add_messages(sorted(loaded_data["messages"], key=lambda item: item["id"]))
 
         self.update_tab()
         self.update_list()
@@ -157,9 +265,13 @@ class View(QtWidgets.QWidget, AbstractView):
 
         self.update_thread.ready.connect(self.fetch_new_messages)
 
-        websocket_handler = WebSocketHandler(self, self.secret, self.device_id)
-        websocket_handler.sync.connect(self.update_thread.start)
-        websocket_handler.connect()
+        self.websocket_handler = WebSocketHandler(self, self.secret, self.device_id)
+        self.websocket_handler.sync.connect(self.update_thread.start)
+        self.websocket_handler.connect()
+
+    def stop_view(self):
+        if self.websocket_handler is not None:
+            self.websocket_handler.stop()
 
     def on_visibility_changed(self, state: bool):
         if state:
@@ -187,13 +299,12 @@ class View(QtWidgets.QWidget, AbstractView):
         new_messages = sorted(response.json()["messages"], key=lambda list_item: list_item["id"])
 
         if new_messages:
-            for message in new_messages:
-                self.add_message(message)
+            added_messages = self.messages.add_messages(new_messages)
 
             if self.isVisible():
                 self.unseen_messages = 0
             else:
-                self.unseen_messages += len(new_messages)
+                self.unseen_messages += len(added_messages)
                 self.update_tab()
 
             self.save_messages()
@@ -236,9 +347,3 @@ class View(QtWidgets.QWidget, AbstractView):
 
             tab_widget.append_tab_title(tab_index, tab_title)
             tab_widget.setTabIcon(tab_index, tab_icon)
-
-    def add_message(self, message):
-        if list(filter(lambda this_message: this_message["id"] == message["id"], self.messages)):
-            return
-
-        self.messages.append(message)
@@ -1,17 +1,25 @@
 import datetime
+import hashlib
+import heapq
+import json
+import os
+import sys
+import threading
+import time
 import traceback
 import uuid
-from functools import cmp_to_key
 from typing import List, Dict
 
 import caldav
+import caldav.lib.error
 import dbus
 import pytz
 from PyQt5 import QtCore, QtWidgets, QtGui
+from caldav.elements import dav, cdav
 from dateutil.tz import tzlocal
 from pytz import timezone
 
-from lib.common import Timer, AbstractView, get_dashboard_instance
+from lib.common import Timer, AbstractView, ThreadedCall, get_cache_path, get_dashboard_instance
 from modules.calendar import escape_ical_string, Calendar
 
 
@@ -23,47 +31,78 @@ class TodoListConfig:
 
 
 class TodoItem:
+    # Only the parsed fields are kept, the todo is recreated from its data once it gets changed
+    fields = ["url", "calendar", "etag", "data", "uid", "parent_uid", "summary", "description", "due_datetime", "start_datetime", "priority"]
+
     def __init__(self, todo: caldav.Todo):
         self.parent: "TodoItem" = None
-        self.children: Dict[str, "TodoItem"] = {}
-        self.todo = todo
-        self.vtodo = todo.vobject_instance.vtodo
-        self.due_datetime = self.get_datetime("due")
-        self.start_datetime = self.get_datetime("dtstart")
-
-        if hasattr(self.vtodo, "priority"):
-            self.priority = int(self.vtodo.priority.value)
+        self.children: List["TodoItem"] = []
+        self.row = 0
+        self.fetched_children = 0
+        self.display_state = None
+        self.checked = False
+
+        self.update_from_todo(todo)
+
+    def update_from_todo(self, todo: caldav.Todo):
+        # Get the data before parsing it, caldav serializes it again afterwards
+        self.data = todo.data
+        self.url = str(todo.url)
+        self.calendar = todo.parent
+        self.etag = getattr(todo, "etag", None)
+
+        vtodo = todo.vobject_instance.vtodo
+
+        self.uid = vtodo.uid.value
+        self.parent_uid = vtodo.related_to.value if hasattr(vtodo, "related_to") else None
+        self.summary = vtodo.summary.value if hasattr(vtodo, "summary") else None
+        self.description = vtodo.description.value if hasattr(vtodo, "description") else None
+        self.due_datetime = self.get_datetime(vtodo, "due")
+        self.start_datetime = self.get_datetime(vtodo, "dtstart")
+
+        if hasattr(vtodo, "priority"):
+            self.priority = int(vtodo.priority.value)
         else:
             self.priority = 0
 
-    def add_child(self, item: "TodoItem"):
-        self.children[item.get_id()] = item
-        item.parent = self
+    def update_from_item(self, todo_item: "TodoItem"):
+        for field in self.fields:
+            setattr(self, field, getattr(todo_item, field))
 
     def get_id(self):
-        return self.vtodo.uid.value
+        return self.uid
 
     def get_parent_id(self):
-        if hasattr(self.vtodo, "related_to"):
-            return self.vtodo.related_to.value
-        else:
-            return None
+        return self.parent_uid
 
-    def should_show(self, show_before_start):
+    def should_show(self, show_before_start, now: datetime.datetime = None):
         if show_before_start is None:
             return True
 
         if self.start_datetime is None:
             return True
 
-        start_in_days = (self.start_datetime - datetime.datetime.now(datetime.timezone.utc)).days
+        if now is None:
+            now = datetime.datetime.now(datetime.timezone.utc)
+
+        start_in_days = (self.start_datetime - now).days
         return start_in_days <= show_before_start
 
-    def is_overdue(self):
+    def get_show_datetime(self, show_before_start):
+        if show_before_start is None or self.start_datetime is None:
+            return None
+
+        # should_show() uses full days, so the item becomes visible once less than show_before_start + 1 days are left
+        return self.start_datetime - datetime.timedelta(days=show_before_start + 1)
+
+    def is_overdue(self, now: datetime.datetime = None):
         if self.due_datetime is None:
             return False
 
-        return self.due_datetime < datetime.datetime.now(tz=timezone("UTC"))
+        if now is None:
+            now = datetime.datetime.now(tz=timezone("UTC"))
+
+        return self.due_datetime < now
 
     def is_high_priority(self):
         return 1 <= self.priority <= 4
@@ -75,22 +114,35 @@ class TodoItem:
         return 6 <= self.priority <= 9
 
     def get_summary(self):
-        if hasattr(self.vtodo, "summary"):
-            return self.vtodo.summary.value
-        else:
-            return None
+        return self.summary
+
+    def get_todo(self):
+        # Changes are made to a new todo, the synced todo is only updated once the server accepted the change
+        todo = caldav.Todo(client=self.calendar.client, url=self.url, data=self.data, parent=self.calendar)
+        todo.etag = self.etag
+
+        return todo
 
     def complete(self):
-        self.todo.complete()
+        # Same as caldav.Todo.complete() without saving, which is done by the MutationJournal
+        todo = self.get_todo()
+        vtodo = todo.vobject_instance.vtodo
+
+        if hasattr(vtodo, "status"):
+            vtodo.status.value = "COMPLETED"
+        else:
+            vtodo.add("status").value = "COMPLETED"
 
-    def remove(self):
-        self.todo.delete()
+        vtodo.add("completed").value = datetime.datetime.now(tz=timezone("UTC"))
 
-    def get_datetime(self, field: str):
-        if not hasattr(self.vtodo, field):
+        return todo
+
+    @staticmethod
+    def get_datetime(vtodo, field: str):
+        if not hasattr(vtodo, field):
             return None
 
-        value = getattr(self.vtodo, field).value
+        value = getattr(vtodo, field).value
 
         # datetime might be a date instead of datetime object, therefore convert it to a datetime object
         if not isinstance(value, datetime.datetime):
@@ -100,12 +152,14 @@ class TodoItem:
 
     @staticmethod
     def create(calendar: caldav.Calendar, summary: str, description: str = ""):
+        todo_uuid = uuid.uuid4()
+
         ics = [
             "BEGIN:VCALENDAR",
             "VERSION:2.0",
             "PRODID:-//Dashboard//CalDAV Client//EN",
             "BEGIN:VTODO",
-            "UID:{}@dashboard.selfcoders.com".format(uuid.uuid4()),
+            "UID:{}@dashboard.selfcoders.com".format(todo_uuid),
             "DTSTAMP:{}".format(datetime.datetime.now().astimezone(tz=timezone("UTC")).strftime("%Y%m%dT%H%M%SZ")),
             "SUMMARY:{}".format(escape_ical_string(summary)),
             "DESCRIPTION:{}".format(escape_ical_string(description)),
@@ -113,15 +167,15 @@ class TodoItem:
             "END:VCALENDAR"
         ]
 
-        calendar.add_todo("\n".join(ics))
+        return caldav.Todo(client=calendar.client, url=calendar.url.join("{}.ics".format(todo_uuid)), data="\n".join(ics), parent=calendar)
 
 
 class TodoDialog(QtWidgets.QDialog):
-    def __init__(self, parent, calendars: List["Calendar"], default_todo_list=None, todo_item: TodoItem = None, updater_thread: "Updater" = None):
+    def __init__(self, parent, calendars: List["Calendar"], default_todo_list=None, todo_item: TodoItem = None, journal: "MutationJournal" = None):
         super().__init__(parent)
 
         self.todo_item = todo_item
-        self.updater_thread = updater_thread
+        self.journal = journal
 
         self.setModal(True)
 
@@ -152,8 +206,8 @@ class TodoDialog(QtWidgets.QDialog):
 
         self.title_widget = QtWidgets.QLineEdit()
 
-        if todo_item is not None and hasattr(todo_item.vtodo, "summary"):
-            self.title_widget.setText(todo_item.vtodo.summary.value)
+        if todo_item is not None and todo_item.summary is not None:
+            self.title_widget.setText(todo_item.summary)
 
         layout.addWidget(self.title_widget, 1, 1)
 
@@ -161,8 +215,8 @@ class TodoDialog(QtWidgets.QDialog):
 
         self.notes_widget = QtWidgets.QTextEdit()
 
-        if todo_item is not None and hasattr(todo_item.vtodo, "description"):
-            self.notes_widget.setPlainText(todo_item.vtodo.description.value)
+        if todo_item is not None and todo_item.description is not None:
+            self.notes_widget.setPlainText(todo_item.description)
 
         layout.addWidget(self.notes_widget, 2, 1)
 
@@ -218,61 +272,518 @@ class TodoDialog(QtWidgets.QDialog):
             return
 
         if self.todo_item is None:
-            TodoItem.create(calendar, title, notes)
+            todo = TodoItem.create(calendar, title, notes)
+            create = True
         else:
-            if hasattr(self.todo_item.vtodo, "summary"):
-                self.todo_item.vtodo.summary.value = title
+            todo = self.todo_item.get_todo()
+            vtodo = todo.vobject_instance.vtodo
+
+            if hasattr(vtodo, "summary"):
+                vtodo.summary.value = title
             else:
-                self.todo_item.vtodo.add("summary").value = title
+                vtodo.add("summary").value = title
 
-            if hasattr(self.todo_item.vtodo, "description"):
-                self.todo_item.vtodo.description.value = notes
+            if hasattr(vtodo, "description"):
+                vtodo.description.value = notes
             else:
-                self.todo_item.vtodo.add("description").value = notes
+                vtodo.add("description").value = notes
 
             if due_date:
-                if hasattr(self.todo_item.vtodo, "due"):
-                    self.todo_item.vtodo.due.value = due_date
+                if hasattr(vtodo, "due"):
+                    vtodo.due.value = due_date
                 else:
-                    self.todo_item.vtodo.add("due").value = due_date
+                    vtodo.add("due").value = due_date
 
-                if hasattr(self.todo_item.vtodo, "dtstart"):
-                    self.todo_item.vtodo.dtstart.value = due_date
+                if hasattr(vtodo, "dtstart"):
+                    vtodo.dtstart.value = due_date
                 else:
-                    self.todo_item.vtodo.add("dtstart").value = due_date
+                    vtodo.add("dtstart").value = due_date
             else:
-                if hasattr(self.todo_item.vtodo, "due"):
-                    del self.todo_item.vtodo.due
+                if hasattr(vtodo, "due"):
+                    del vtodo.due
 
-                if hasattr(self.todo_item.vtodo, "dtstart"):
-                    del self.todo_item.vtodo.dtstart
+                if hasattr(vtodo, "dtstart"):
+                    del vtodo.dtstart
 
-            self.todo_item.todo.save()
+            create = False
 
-        if self.updater_thread:
-            self.updater_thread.start()
+        if self.journal:
+            self.journal.save_todo(todo, create)
 
         self.accept()
 
 
-class TodoListWidget(QtWidgets.QTreeWidget):
-    def __init__(self, view_widget: "View", calendar: "Calendar", calendar_manager: "CalendarManager", updater_thread: "Updater", show_before_start, item_style: dict):
+class TodoIndex:
+    def __init__(self):
+        self.todo_items: Dict[str, TodoItem] = {}
+        self.todo_list_widgets: Dict[str, "TodoListWidget"] = {}
+        self.list_ids: Dict["TodoListWidget", set] = {}
+        self.parent_ids: Dict[str, str] = {}
+        self.child_ids: Dict[str, set] = {}
+        self.due_datetimes: Dict[str, datetime.datetime] = {}
+        self.due_heap = []
+
+    def update_list(self, todo_list_widget: "TodoListWidget", todo_items: Dict[str, TodoItem]):
+        new_ids = set(todo_items.keys())
+
+        for todo_id in self.list_ids.get(todo_list_widget, set()) - new_ids:
+            # The todo might have been moved to another list in the meantime
+            if self.todo_list_widgets.get(todo_id) is todo_list_widget:
+                self.remove_item(todo_id)
+
+        for todo_item in todo_items.values():
+            self.add_item(todo_list_widget, todo_item)
+
+        self.list_ids[todo_list_widget] = new_ids
+
+        # Drop outdated entries once they make up the majority of the heap
+        if len(self.due_heap) > 2 * len(self.todo_items) + 100:
+            self.due_heap = [(todo_item.due_datetime, todo_id) for todo_id, todo_item in self.todo_items.items() if todo_item.due_datetime is not None]
+            heapq.heapify(self.due_heap)
+
+    def add_item(self, todo_list_widget: "TodoListWidget", todo_item: TodoItem):
+        todo_id = todo_item.get_id()
+        parent_id = todo_item.get_parent_id()
+
+        # Items are updated in place, so compare against the previously indexed values
+        if self.parent_ids.get(todo_id) != parent_id:
+            self.remove_child_id(todo_id)
+
+            if parent_id is not None:
+                self.parent_ids[todo_id] = parent_id
+                self.child_ids.setdefault(parent_id, set()).add(todo_id)
+
+        if self.due_datetimes.get(todo_id) != todo_item.due_datetime:
+            self.due_datetimes[todo_id] = todo_item.due_datetime
+
+            if todo_item.due_datetime is not None:
+                heapq.heappush(self.due_heap, (todo_item.due_datetime, todo_id))
+
+        self.todo_items[todo_id] = todo_item
+        self.todo_list_widgets[todo_id] = todo_list_widget
+
+    def remove_item(self, todo_id: str):
+        del self.todo_items[todo_id]
+        del self.todo_list_widgets[todo_id]
+        self.due_datetimes.pop(todo_id, None)
+
+        self.remove_child_id(todo_id)
+
+    def remove_child_id(self, todo_id: str):
+        parent_id = self.parent_ids.pop(todo_id, None)
+
+        if parent_id is None:
+            return
+
+        self.child_ids[parent_id].discard(todo_id)
+
+        if not self.child_ids[parent_id]:
+            del self.child_ids[parent_id]
+
+    def get_item(self, todo_id: str):
+        return self.todo_items.get(todo_id)
+
+    def get_list_widget(self, todo_item: TodoItem):
+        return self.todo_list_widgets.get(todo_item.get_id())
+
+    def get_parent(self, todo_item: TodoItem):
+        parent_id = todo_item.get_parent_id()
+
+        if parent_id is None:
+            return None
+
+        return self.todo_items.get(parent_id)
+
+    def get_children(self, todo_item: TodoItem):
+        return [self.todo_items[child_id] for child_id in self.child_ids.get(todo_item.get_id(), set())]
+
+    def get_descendants(self, todo_item: TodoItem):
+        descendants = []
+        pending_items = [todo_item]
+        seen_ids = {todo_item.get_id()}
+
+        while pending_items:
+            for child in self.get_children(pending_items.pop()):
+                # Guard against cyclic relations
+                if child.get_id() in seen_ids:
+                    continue
+
+                seen_ids.add(child.get_id())
+                descendants.append(child)
+                pending_items.append(child)
+
+        return descendants
+
+    def get_overdue_item(self, now: datetime.datetime = None):
+        while self.due_heap:
+            due_datetime, todo_id = self.due_heap[0]
+            todo_item = self.todo_items.get(todo_id)
+
+            # Skip entries of removed todos or todos whose due date has been changed
+            if todo_item is None or todo_item.due_datetime != due_datetime:
+                heapq.heappop(self.due_heap)
+                continue
+
+            return todo_item if todo_item.is_overdue(now) else None
+
+        return None
+
+
+class TodoModel(QtCore.QAbstractItemModel):
+    todo_checked = QtCore.pyqtSignal(object)
+
+    # Number of rows populated at once, further rows are fetched once the view needs them
+    fetch_batch_size = 200
+
+    def __init__(self, todo_list_widget: "TodoListWidget"):
+        super().__init__(todo_list_widget)
+
+        self.todo_list_widget = todo_list_widget
+        self.root_items: List[TodoItem] = []
+        self.fetched_root_items = 0
+
+    def get_child_items(self, parent_item: TodoItem):
+        if parent_item is None:
+            return self.root_items
+
+        return parent_item.children
+
+    def get_fetched_item_count(self, parent_item: TodoItem):
+        if parent_item is None:
+            return self.fetched_root_items
+
+        return parent_item.fetched_children
+
+    def set_fetched_item_count(self, parent_item: TodoItem, count: int):
+        if parent_item is None:
+            self.fetched_root_items = count
+        else:
+            parent_item.fetched_children = count
+
+    def index_for_parent(self, parent_item: TodoItem):
+        if parent_item is None:
+            return QtCore.QModelIndex()
+
+        return self.index_for_item(parent_item)
+
+    @staticmethod
+    def update_rows(todo_items: List[TodoItem], first_row: int):
+        for row in range(first_row, len(todo_items)):
+            todo_items[row].row = row
+
+    def update_items(self, child_items: Dict[str, List[TodoItem]]):
+        # Update the rows by their UID (instead of resetting the model) to keep the selection, expanded state and scroll position
+        # child_items contains the children of each todo (None for the root items) in display order
+        self.remove_child_items(None, child_items)
+        self.insert_child_items(None, child_items)
+
+    def remove_child_items(self, parent_item: TodoItem, child_items: Dict[str, List[TodoItem]]):
+        children = self.get_child_items(parent_item)
+        parent_index = self.index_for_parent(parent_item)
+        new_ids = {todo_item.get_id() for todo_item in child_items.get(None if parent_item is None else parent_item.get_id(), [])}
+
+        row = len(children) - 1
+
+        while row >= 0:
+            if children[row].get_id() in new_ids:
+                row -= 1
+                continue
+
+            last_row = row
+
+            while row >= 0 and children[row].get_id() not in new_ids:
+                row -= 1
+
+            first_row = row + 1
+            fetched_count = self.get_fetched_item_count(parent_item)
+
+            # Rows which have not been fetched yet are unknown to the view
+            removed_fetched_rows = max(0, min(last_row + 1, fetched_count) - first_row)
+
+            if removed_fetched_rows:
+                self.beginRemoveRows(parent_index, first_row, first_row + removed_fetched_rows - 1)
+
+            del children[first_row:last_row + 1]
+
+            self.set_fetched_item_count(parent_item, fetched_count - removed_fetched_rows)
+            self.update_rows(children, first_row)
+
+            if removed_fetched_rows:
+                self.endRemoveRows()
+
+        for todo_item in children[:self.get_fetched_item_count(parent_item)]:
+            self.remove_child_items(todo_item, child_items)
+
+    def insert_child_items(self, parent_item: TodoItem, child_items: Dict[str, List[TodoItem]]):
+        children = self.get_child_items(parent_item)
+        parent_index = self.index_for_parent(parent_item)
+        existing_items = set(children)
+        pending_items = []
+        row = 0
+
+        def insert_pending_items():
+            nonlocal row, pending_items
+
+            if not pending_items:
+                return
+
+            fetched_count = self.get_fetched_item_count(parent_item)
+
+            if row < fetched_count:
+                inserted_fetched_rows = len(pending_items)
+            elif row == fetched_count == len(children):
+                # Appended rows are fetched up to the batch size, remaining ones once the view needs them
+                inserted_fetched_rows = min(len(pending_items), max(0, self.fetch_batch_size - fetched_count))
+            else:
+                inserted_fetched_rows = 0
+
+            if inserted_fetched_rows:
+                self.beginInsertRows(parent_index, row, row + inserted_fetched_rows - 1)
+
+            for todo_item in pending_items:
+                todo_item.parent = parent_item
+                self.set_child_items(todo_item, child_items)
+
+            children[row:row] = pending_items
+
+            self.set_fetched_item_count(parent_item, fetched_count + inserted_fetched_rows)
+            self.update_rows(children, row)
+
+            if inserted_fetched_rows:
+                self.endInsertRows()
+
+            row += len(pending_items)
+            pending_items = []
+
+        for todo_item in child_items.get(None if parent_item is None else parent_item.get_id(), []):
+            if todo_item not in existing_items:
+                pending_items.append(todo_item)
+                continue
+
+            insert_pending_items()
+
+            fetched_count = self.get_fetched_item_count(parent_item)
+            known_to_view = row < fetched_count
+
+            if children[row] is not todo_item:
+                # The order has changed (e.g. changed due date), move the existing item
+                old_row = children.index(todo_item, row)
+                known_to_view = old_row < fetched_count
+
+                if old_row < fetched_count:
+                    self.beginMoveRows(parent_index, old_row, old_row, parent_index, row)
+                elif row < fetched_count:
+                    # Moved from the rows which have not been fetched yet
+                    self.beginInsertRows(parent_index, row, row)
+                    self.set_fetched_item_count(parent_item, fetched_count + 1)
+
+                children.insert(row, children.pop(old_row))
+                self.update_rows(children, row)
+
+                if old_row < fetched_count:
+                    self.endMoveRows()
+                elif row < fetched_count:
+                    self.endInsertRows()
+
+            if known_to_view:
+                self.insert_child_items(todo_item, child_items)
+            else:
+                self.set_child_items(todo_item, child_items)
+
+            row += 1
+
+        insert_pending_items()
+
+    def set_child_items(self, parent_item: TodoItem, child_items: Dict[str, List[TodoItem]]):
+        # The children of rows unknown to the view can be replaced without notifying it
+        parent_item.children = list(child_items.get(parent_item.get_id(), []))
+        parent_item.fetched_children = 0
+
+        for row, todo_item in enumerate(parent_item.children):
+            todo_item.parent = parent_item
+            todo_item.row = row
+
+            self.set_child_items(todo_item, child_items)
+
+    def get_children(self, parent: QtCore.QModelIndex):
+        if parent.isValid():
+            return parent.internalPointer().children
+
+        return self.root_items
+
+    def get_fetched_count(self, parent: QtCore.QModelIndex):
+        if parent.isValid():
+            return parent.internalPointer().fetched_children
+
+        return self.fetched_root_items
+
+    def index_for_item(self, todo_item: TodoItem):
+        if todo_item.parent is None:
+            fetched_count = self.fetched_root_items
+        else:
+            fetched_count = todo_item.parent.fetched_children
+
+        # Rows which have not been fetched yet do not have an index
+        if todo_item.row >= fetched_count:
+            return QtCore.QModelIndex()
+
+        return self.createIndex(todo_item.row, 0, todo_item)
+
+    def refresh_item(self, todo_item: TodoItem):
+        todo_item.display_state = None
+
+        model_index = self.index_for_item(todo_item)
+
+        if model_index.isValid():
+            self.dataChanged.emit(model_index, model_index)
+
+    def index(self, row, column, parent=QtCore.QModelIndex()):
+        if column != 0 or row < 0 or row >= self.get_fetched_count(parent):
+            return QtCore.QModelIndex()
+
+        return self.createIndex(row, column, self.get_children(parent)[row])
+
+    def parent(self, index: QtCore.QModelIndex):
+        if not index.isValid():
+            return QtCore.QModelIndex()
+
+        parent_item = index.internalPointer().parent
+
+        if parent_item is None:
+            return QtCore.QModelIndex()
+
+        return self.createIndex(parent_item.row, 0, parent_item)
+
+    def rowCount(self, parent=QtCore.QModelIndex()):
+        if parent.column() > 0:
+            return 0
+
+        return self.get_fetched_count(parent)
+
+    def columnCount(self, parent=QtCore.QModelIndex()):
+        return 1
+
+    def hasChildren(self, parent=QtCore.QModelIndex()):
+        return len(self.get_children(parent)) > 0
+
+    def canFetchMore(self, parent: QtCore.QModelIndex):
+        return self.get_fetched_count(parent) < len(self.get_children(parent))
+
+    def fetchMore(self, parent: QtCore.QModelIndex):
+        fetched_count = self.get_fetched_count(parent)
+        count = min(self.fetch_batch_size, len(self.get_children(parent)) - fetched_count)
+
+        if count <= 0:
+            return
+
+        self.beginInsertRows(parent, fetched_count, fetched_count + count - 1)
+
+        if parent.isValid():
+            parent.internalPointer().fetched_children += count
+        else:
+            self.fetched_root_items += count
+
+        self.endInsertRows()
+
+    def flags(self, index: QtCore.QModelIndex):
+        if not index.isValid():
+            return QtCore.Qt.NoItemFlags
+
+        return QtCore.Qt.ItemIsEnabled | QtCore.Qt.ItemIsSelectable | QtCore.Qt.ItemIsUserCheckable
+
+    def data(self, index: QtCore.QModelIndex, role=QtCore.Qt.DisplayRole):
+        if not index.isValid():
+            return None
+
+        todo_item: TodoItem = index.internalPointer()
+
+        if role == QtCore.Qt.CheckStateRole:
+            return QtCore.Qt.Checked if todo_item.checked else QtCore.Qt.Unchecked
+
+        text, styles, bold, pending = self.todo_list_widget.get_display_state(todo_item)
+
+        if role == QtCore.Qt.DisplayRole:
+            return text
+        elif role == QtCore.Qt.ToolTipRole:
+            return "{} (not saved yet)".format(text) if pending else text
+        elif role == QtCore.Qt.ForegroundRole:
+            return self.todo_list_widget.get_style_brush(styles, "foreground_color")
+        elif role == QtCore.Qt.BackgroundRole:
+            return self.todo_list_widget.get_style_brush(styles, "background_color")
+        elif role == QtCore.Qt.FontRole:
+            if not bold and not pending:
+                return None
+
+            font = QtGui.QFont(self.todo_list_widget.font())
+            font.setBold(bold)
+            font.setItalic(pending)
+
+            return font
+
+        return None
+
+    def setData(self, index: QtCore.QModelIndex, value, role=QtCore.Qt.EditRole):
+        if not index.isValid() or role != QtCore.Qt.CheckStateRole:
+            return False
+
+        todo_item: TodoItem = index.internalPointer()
+
+        if value != QtCore.Qt.Checked or todo_item.checked:
+            return False
+
+        todo_item.checked = True
+        self.dataChanged.emit(index, index, [QtCore.Qt.CheckStateRole])
+        self.todo_checked.emit(todo_item)
+
+        return True
+
+
+class TodoListWidget(QtWidgets.QTreeView):
+    deadlines_passed = QtCore.pyqtSignal()
+
+    def __init__(self, view_widget: "View", calendar: "Calendar", calendar_manager: "CalendarManager", journal: "MutationJournal", todo_index: TodoIndex, show_before_start, item_style: dict):
         super().__init__()
 
         self.view_widget = view_widget
         self.calendar = calendar
         self.calendar_manager = calendar_manager
-        self.updater_thread = updater_thread
+        self.journal = journal
+        self.todo_index = todo_index
+        self.pending_urls = set()
+        self.todos: List[caldav.Todo] = []
+        self.deadlines = []
         self.show_before_start = show_before_start
         self.item_style = item_style
         self.overdue_todo_item = None
-
+        self.todo_items: Dict[str, TodoItem] = {}
+        self.foreign_child_items: List[TodoItem] = []
+        self.style_brushes = {}
+        self.collapsed_ids = set()
+        self.rows_to_expand: List[QtCore.QPersistentModelIndex] = []
+
+        self.deadline_timer = QtCore.QTimer(self)
+        self.deadline_timer.setSingleShot(True)
+        self.deadline_timer.setTimerType(QtCore.Qt.PreciseTimer)
+        self.deadline_timer.timeout.connect(self.process_deadlines)
+
+        self.todo_model = TodoModel(self)
+        self.todo_model.todo_checked.connect(self.complete_todo)
+        self.todo_model.rowsInserted.connect(self.queue_rows_to_expand)
+
+        self.setModel(self.todo_model)
         self.setHeaderHidden(True)
-        self.itemChanged.connect(self.update_todo)
-        self.itemDoubleClicked.connect(self.show_todo)
+        self.setUniformRowHeights(True)
+        self.doubleClicked.connect(self.show_todo)
+        self.expanded.connect(lambda model_index: self.collapsed_ids.discard(model_index.internalPointer().get_id()))
+        self.collapsed.connect(lambda model_index: self.collapsed_ids.add(model_index.internalPointer().get_id()))
+
+        self.setSelectionMode(QtWidgets.QAbstractItemView.ExtendedSelection)
 
         self.context_menu = QtWidgets.QMenu()
-        self.context_menu.addAction("Edit", self.menu_edit_todo)
+        self.context_menu.addAction("Complete", self.menu_complete_todos)
+        self.edit_action = self.context_menu.addAction("Edit", self.menu_edit_todo)
+        self.context_menu.addSeparator()
+        self.move_menu = self.context_menu.addMenu("Move to")
         self.context_menu.addSeparator()
         self.context_menu.addAction("Delete", self.menu_remove_todo)
 
@@ -280,127 +791,301 @@ class TodoListWidget(QtWidgets.QTreeWidget):
         self.customContextMenuRequested.connect(self.show_context_menu)
 
     def show_context_menu(self, position):
-        if not self.itemAt(position):
+        if not self.indexAt(position).isValid():
             return
 
+        self.edit_action.setEnabled(len(self.selectionModel().selectedRows()) == 1)
+
+        self.move_menu.clear()
+
+        for todo_list_widget in self.view_widget.todo_lists.values():
+            if todo_list_widget is not self:
+                self.move_menu.addAction(todo_list_widget.calendar.name, lambda calendar=todo_list_widget.calendar: self.menu_move_todos(calendar))
+
+        self.move_menu.setEnabled(not self.move_menu.isEmpty())
+
         self.context_menu.exec(self.mapToGlobal(position))
 
+    def get_selected_todo_items(self):
+        return [model_index.internalPointer() for model_index in self.selectionModel().selectedRows()]
+
     def menu_edit_todo(self):
-        selected_items = self.selectedItems()
+        selected_items = self.get_selected_todo_items()
 
         if len(selected_items) == 0:
             return
 
-        self.show_todo(selected_items[0])
+        TodoDialog(self, self.calendar_manager.todo_lists, self.calendar.name, selected_items[0], self.journal)
+
+    def menu_complete_todos(self):
+        self.complete_todos(self.get_selected_todo_items())
+
+    def menu_move_todos(self, calendar: Calendar):
+        self.journal.move_todos([todo_item.get_todo() for todo_item in self.get_selected_todo_items()], calendar)
 
     def menu_remove_todo(self):
-        selected_items = self.selectedItems()
+        selected_items = self.get_selected_todo_items()
 
         if len(selected_items) == 0:
             return
 
-        todo_item: TodoItem = selected_items[0].data(0, QtCore.Qt.UserRole)
+        if len(selected_items) == 1:
+            question = "Are you sure to remove the selected todo '{}'?".format(selected_items[0].get_summary())
+        else:
+            question = "Are you sure to remove the {} selected todos?".format(len(selected_items))
 
-        if QtWidgets.QMessageBox.question(self, "Remove todo", "Are you sure to remove the selected todo '{}'?".format(todo_item.get_summary())) == QtWidgets.QMessageBox.Yes:
-            todo_item.remove()
-            self.updater_thread.start()
+        if QtWidgets.QMessageBox.question(self, "Remove todo", question) == QtWidgets.QMessageBox.Yes:
+            self.journal.delete_todos([todo_item.get_todo() for todo_item in selected_items])
 
     def update_items(self, todos):
+        now = datetime.datetime.now(datetime.timezone.utc)
+
+        self.todos = todos
+        self.deadlines = []
+
         todo_items = {}
+        existing_items = []
 
         for item in todos:
-            todo_item = TodoItem(item)
+            new_todo_item = TodoItem(item)
 
-            if not todo_item.should_show(self.show_before_start):
+            if not new_todo_item.should_show(self.show_before_start, now):
+                self.deadlines.append((new_todo_item.get_show_datetime(self.show_before_start), new_todo_item.get_id(), "show"))
                 continue
 
+            # Reuse the existing items to keep their rows in the model
+            todo_item = self.todo_items.get(new_todo_item.get_id())
+
+            if todo_item is None:
+                todo_item = new_todo_item
+            else:
+                todo_item.update_from_item(new_todo_item)
+                existing_items.append(todo_item)
+
             todo_items[todo_item.get_id()] = todo_item
 
+            for deadline, kind in [(todo_item.due_datetime, "due"), (todo_item.start_datetime, "start")]:
+                if deadline is not None and deadline > now:
+                    self.deadlines.append((deadline, todo_item.get_id(), kind))
+
+        heapq.heapify(self.deadlines)
+
         todo_item: TodoItem
+        child_items = {None: []}
+        foreign_child_items = []
+
         for todo_item in todo_items.values():
             parent_id = todo_item.get_parent_id()
 
             if parent_id is not None and parent_id in todo_items:
-                todo_items[parent_id].add_child(todo_item)
+                child_items.setdefault(parent_id, []).append(todo_item)
+            else:
+                child_items[None].append(todo_item)
 
-        root_items = []
-        for todo_item in todo_items.values():
-            parent_id = todo_item.get_parent_id()
+                # The parent might be part of another todo list
+                if parent_id is not None:
+                    foreign_child_items.append(todo_item)
 
-            if parent_id is not None and parent_id in todo_items:
-                continue
+        self.pending_urls = self.journal.get_pending_urls(str(self.calendar.url))
 
-            root_items.append(todo_item)
+        self.todo_model.update_items(child_items)
+        self.refresh_existing_items(existing_items)
 
-        self.overdue_todo_item = None
-        self.clear()
-        self.add_from_list(self, root_items)
+        self.todo_items = todo_items
+        self.foreign_child_items = foreign_child_items
+        self.todo_index.update_list(self, todo_items)
+
+        self.overdue_todo_item = next((todo_item for todo_item in todo_items.values() if todo_item.is_overdue(now)), None)
 
-    def add_from_list(self, parent_item, todo_items: List[TodoItem]):
+        self.schedule_deadlines()
+
+    def refresh_existing_items(self, todo_items: List[TodoItem]):
         for todo_item in todo_items:
-            summary = todo_item.vtodo.summary.value
+            # Items which have not been displayed yet are rendered lazily anyway
+            if todo_item.display_state is None and not todo_item.checked:
+                continue
 
-            text = summary
+            old_state = todo_item.display_state
+            todo_item.display_state = None
 
-            if todo_item.due_datetime is not None:
-                text = "{} ({})".format(summary, todo_item.due_datetime.astimezone(tzlocal()).strftime("%d.%m.%Y %H:%M"))
+            if todo_item.checked or self.get_display_state(todo_item) != old_state:
+                todo_item.checked = False
+                self.todo_model.refresh_item(todo_item)
 
-            list_item = QtWidgets.QTreeWidgetItem(parent_item)
+    def refresh_foreign_child_items(self):
+        for todo_item in self.foreign_child_items:
+            old_state = todo_item.display_state
 
-            list_item.setText(0, text)
-            list_item.setToolTip(0, text)
-            list_item.setFlags(list_item.flags() | QtCore.Qt.ItemIsTristate | QtCore.Qt.ItemIsUserCheckable)
-            list_item.setCheckState(0, QtCore.Qt.Unchecked)
-            list_item.setExpanded(True)
-            list_item.setData(0, QtCore.Qt.UserRole, todo_item)
+            if old_state is None:
+                continue
 
-            font = list_item.font(0)
+            todo_item.display_state = None
 
-            self.set_item_style(list_item, "default")
+            if self.get_display_state(todo_item) != old_state:
+                self.todo_model.refresh_item(todo_item)
 
-            if todo_item.due_datetime is not None:
-                if todo_item.is_overdue():
-                    self.overdue_todo_item = todo_item
-                    self.set_item_style(list_item, "overdue", "red")
-                else:
-                    self.set_item_style(list_item, "has_duedate", "#FFD800")
+    def show_todo_item(self, todo_item: TodoItem):
+        ancestors = []
+        parent = todo_item
+
+        while parent is not None:
+            ancestors.insert(0, parent)
+            parent = parent.parent
+
+        # Fetch the rows down to the todo and expand its parents
+        parent_index = QtCore.QModelIndex()
+
+        for item in ancestors:
+            while item.row >= self.todo_model.get_fetched_count(parent_index) and self.todo_model.canFetchMore(parent_index):
+                self.todo_model.fetchMore(parent_index)
+
+            model_index = self.todo_model.index_for_item(item)
+
+            if not model_index.isValid():
+                return
+
+            if item is not todo_item:
+                self.expand(model_index)
+
+            parent_index = model_index
+
+        self.setCurrentIndex(parent_index)
+        self.scrollTo(parent_index)
+
+    def queue_rows_to_expand(self, parent: QtCore.QModelIndex, first: int, last: int):
+        for row in range(first, last + 1):
+            model_index = self.todo_model.index(row, 0, parent)
+
+            if self.todo_model.hasChildren(model_index) and model_index.internalPointer().get_id() not in self.collapsed_ids:
+                self.rows_to_expand.append(QtCore.QPersistentModelIndex(model_index))
+
+        # Expanding fetches the children, which must not happen while the model is still emitting its signals
+        if self.rows_to_expand:
+            QtCore.QTimer.singleShot(0, self.expand_queued_rows)
+
+    def expand_queued_rows(self):
+        rows_to_expand = self.rows_to_expand
+        self.rows_to_expand = []
+
+        for model_index in rows_to_expand:
+            if model_index.isValid():
+                self.expand(QtCore.QModelIndex(model_index))
+
+    def get_display_state(self, todo_item: TodoItem):
+        if todo_item.display_state is not None:
+            return todo_item.display_state
+
+        summary = todo_item.summary or ""
+
+        if todo_item.parent is None:
+            foreign_parent = self.todo_index.get_parent(todo_item)
+            foreign_list_widget = None if foreign_parent is None else self.todo_index.get_list_widget(foreign_parent)
+
+            if foreign_list_widget is not None and foreign_list_widget is not self:
+                summary = "{} › {} › {}".format(foreign_list_widget.calendar.name, foreign_parent.get_summary(), summary)
+
+        text = summary
+
+        if todo_item.due_datetime is not None:
+            text = "{} ({})".format(summary, todo_item.due_datetime.astimezone(tzlocal()).strftime("%d.%m.%Y %H:%M"))
+
+        styles = [("default", None)]
+
+        if todo_item.due_datetime is not None:
+            if todo_item.is_overdue():
+                styles.append(("overdue", "red"))
+            else:
+                styles.append(("has_duedate", "#FFD800"))
+
+        if todo_item.start_datetime is not None:
+            if (todo_item.start_datetime - datetime.datetime.now(datetime.timezone.utc)).total_seconds() > 0:
+                styles.append(("not_started", "gray"))
+
+        pending = todo_item.url in self.pending_urls
+
+        todo_item.display_state = (text, tuple(styles), todo_item.is_high_priority(), pending)
+
+        return todo_item.display_state
+
+    def get_style_brush(self, styles: tuple, color_name: str):
+        key = (styles, color_name)
+
+        if key not in self.style_brushes:
+            brush = None
+
+            for style_name, default_foreground_color in styles:
+                style_config = self.item_style.get(style_name, {})
 
-            if todo_item.start_datetime is not None:
-                if (todo_item.start_datetime - datetime.datetime.now(datetime.timezone.utc)).total_seconds() > 0:
-                    self.set_item_style(list_item, "not_started", "gray")
+                color = style_config.get(color_name, default_foreground_color if color_name == "foreground_color" else None)
+                if color is not None:
+                    brush = QtGui.QBrush(QtGui.QColor(color))
 
-            if todo_item.is_high_priority():
-                font.setBold(True)
+            self.style_brushes[key] = brush
 
-            list_item.setFont(0, font)
+        return self.style_brushes[key]
 
-            self.add_from_list(list_item, [child_item for child_item in todo_item.children.values()])
+    def schedule_deadlines(self):
+        if not self.deadlines:
+            self.deadline_timer.stop()
+            return
+
+        interval = (self.deadlines[0][0] - datetime.datetime.now(datetime.timezone.utc)).total_seconds() * 1000
+
+        # Wait a bit longer to make sure the deadline has passed and limit the interval to a day (QTimer uses 32 bit integers)
+        self.deadline_timer.start(int(min(max(interval, 0) + 100, 24 * 60 * 60 * 1000)))
+
+    def process_deadlines(self):
+        now = datetime.datetime.now(datetime.timezone.utc)
+
+        show_items = False
+        restyle_ids = set()
+
+        while self.deadlines and self.deadlines[0][0] <= now:
+            _, todo_id, kind = heapq.heappop(self.deadlines)
+
+            if kind == "show":
+                show_items = True
+            else:
+                restyle_ids.add(todo_id)
+
+        if show_items:
+            # New items became visible, rebuild the hierarchy from the already fetched todos
+            self.update_items(self.todos)
+        else:
+            for todo_id in restyle_ids:
+                todo_item = self.todo_items.get(todo_id)
 
-    def set_item_style(self, list_item: QtWidgets.QTreeWidgetItem, style_name: str, default_foreground_color: str = None, default_background_color: str = None):
-        style_config = self.item_style.get(style_name, {})
+                if todo_item is None:
+                    continue
 
-        foreground_color = style_config.get("foreground_color", default_foreground_color)
-        if foreground_color is not None:
-            list_item.setForeground(0, QtGui.QBrush(QtGui.QColor(foreground_color)))
+                if self.overdue_todo_item is None and todo_item.is_overdue(now):
+                    self.overdue_todo_item = todo_item
 
-        background_color = style_config.get("background_color", default_background_color)
-        if background_color is not None:
-            list_item.setBackground(0, QtGui.QBrush(QtGui.QColor(background_color)))
+                self.todo_model.refresh_item(todo_item)
 
-    def show_todo(self, list_item: QtWidgets.QTreeWidgetItem):
-        if list_item is None:
+            self.schedule_deadlines()
+
+        if show_items or restyle_ids:
+            self.deadlines_passed.emit()
+
+    def show_todo(self, model_index: QtCore.QModelIndex):
+        if not model_index.isValid():
             return
 
-        todo_item: TodoItem = list_item.data(0, QtCore.Qt.UserRole)
+        TodoDialog(self, self.calendar_manager.todo_lists, self.calendar.name, model_index.internalPointer(), self.journal)
+
+    def complete_todo(self, todo_item: TodoItem):
+        self.complete_todos([todo_item])
 
-        TodoDialog(self, self.calendar_manager.todo_lists, self.calendar.name, todo_item, self.view_widget.updater)
+    def complete_todos(self, todo_items: List[TodoItem]):
+        completed_items = {}
 
-    def update_todo(self, list_item: QtWidgets.QTreeWidgetItem):
-        todo_item: TodoItem = list_item.data(0, QtCore.Qt.UserRole)
+        # Completing a todo also completes its subtasks, including the ones in other todo lists
+        for todo_item in todo_items:
+            for item in [todo_item] + self.todo_index.get_descendants(todo_item):
+                completed_items[item.get_id()] = item
 
-        if list_item.checkState(0) == QtCore.Qt.Checked:
-            todo_item.complete()
-            self.updater_thread.start()
+        self.journal.save_todos([item.complete() for item in completed_items.values()])
 
 
 class DBusHandler(dbus.service.Object):
@@ -436,29 +1121,538 @@ class CalendarManager:
         return [calendar for calendar in calendars if calendar.supports_component(component)]
 
 
+class TodoListSync:
+    def __init__(self, calendar: caldav.Calendar):
+        self.calendar = calendar
+        self.todos: Dict[str, caldav.Todo] = {}
+        self.sync_token = None
+        self.supports_sync = True
+        self.supports_filter = True
+        self.lock = threading.RLock()
+
+    @staticmethod
+    def is_open_todo(vobject_instance):
+        vtodo = getattr(vobject_instance, "vtodo", None)
+
+        if vtodo is None:
+            return False
+
+        if hasattr(vtodo, "completed"):
+            return False
+
+        if hasattr(vtodo, "status") and vtodo.status.value.upper() in ["COMPLETED", "CANCELLED"]:
+            return False
+
+        return True
+
+    @staticmethod
+    def get_etag(calendar_object):
+        return getattr(calendar_object, "props", {}).get(dav.GetEtag.tag)
+
+    def create_todo(self, url, data: str, etag: str = None):
+        todo = caldav.Todo(client=self.calendar.client, url=url, data=data, parent=self.calendar)
+        todo.etag = etag
+
+        return todo
+
+    def get_todos(self):
+        with self.lock:
+            return dict(self.todos)
+
+    def sync(self):
+        if self.supports_sync and self.sync_token is not None:
+            try:
+                return self.sync_changes()
+            except caldav.lib.error.DAVError:
+                # The token might have expired, start over with a full sync
+                traceback.print_exc()
+
+        return self.full_sync()
+
+    def full_sync(self):
+        sync_token = None
+
+        if self.supports_sync:
+            try:
+                sync_token = self.calendar.get_properties([dav.SyncToken()]).get(dav.SyncToken.tag)
+            except caldav.lib.error.DAVError:
+                traceback.print_exc()
+
+            if not sync_token:
+                self.supports_sync = False
+
+        todos = {}
+
+        for todo in self.query_open_todos():
+            # Also filter on client side in case the server ignored (parts of) the filter
+            if self.is_open_todo(todo.vobject_instance):
+                todos[str(todo.url)] = todo
+
+        with self.lock:
+            self.todos = todos
+            self.sync_token = sync_token
+
+        return True
+
+    def query_open_todos(self):
+        if self.supports_filter:
+            try:
+                todos = []
+
+                # A prop-filter only allows a single text-match, therefore query each open status (or none) separately
+                for status in [None, "NEEDS-ACTION", "IN-PROCESS"]:
+                    todos.extend(self.query_todos(status))
+
+                return todos
+            except caldav.lib.error.DAVError:
+                traceback.print_exc()
+
+                self.supports_filter = False
+
+        todos = self.calendar.todos(sort_keys=[])
+
+        for todo in todos:
+            todo.etag = None
+
+        return todos
+
+    def query_todos(self, status: str = None):
+        if status is None:
+            status_filter = cdav.PropFilter("STATUS") + cdav.NotDefined()
+        else:
+            status_filter = cdav.PropFilter("STATUS") + cdav.TextMatch(status)
+
+        todo_filter = cdav.CompFilter("VTODO") + [cdav.PropFilter("COMPLETED") + cdav.NotDefined(), status_filter]
+
+        query = cdav.CalendarQuery() + [dav.Prop() + [dav.GetEtag(), cdav.CalendarData()], cdav.Filter() + (cdav.CompFilter("VCALENDAR") + todo_filter)]
+
+        _, todos = self.calendar._request_report_build_resultlist(query, caldav.Todo, props=[dav.GetEtag()])
+
+        for todo in todos:
+            todo.etag = self.get_etag(todo)
+
+        return todos
+
+    def sync_changes(self):
+        changes = self.calendar.objects_by_sync_token(sync_token=self.sync_token, load_objects=False)
+
+        updated_todos = {}
+
+        for calendar_object in changes:
+            url = str(calendar_object.url)
+
+            try:
+                calendar_object.load()
+            except caldav.lib.error.NotFoundError:
+                updated_todos[url] = None
+                continue
+
+            if self.is_open_todo(calendar_object.vobject_instance):
+                updated_todos[url] = self.create_todo(calendar_object.url, calendar_object.data, self.get_etag(calendar_object))
+            else:
+                updated_todos[url] = None
+
+        with self.lock:
+            for url, todo in updated_todos.items():
+                if todo is None:
+                    self.todos.pop(url, None)
+                else:
+                    self.todos[url] = todo
+
+            self.sync_token = changes.sync_token
+
+        return bool(updated_todos)
+
+    def apply_put(self, url: str, data: str, etag: str = None):
+        todo = self.create_todo(url, data, etag)
+
+        with self.lock:
+            if self.is_open_todo(todo.vobject_instance):
+                self.todos[url] = todo
+            else:
+                self.todos.pop(url, None)
+
+    def apply_delete(self, url: str):
+        with self.lock:
+            self.todos.pop(url, None)
+
+    def invalidate(self):
+        # Local state might differ from the server, force a full sync next time
+        with self.lock:
+            self.sync_token = None
+
+    def to_snapshot(self):
+        with self.lock:
+            return {
+                "sync_token": self.sync_token,
+                "todos": [{"url": url, "data": todo.data, "etag": getattr(todo, "etag", None)} for url, todo in self.todos.items()]
+            }
+
+    def load_snapshot(self, snapshot: dict):
+        todos = {}
+
+        for todo in snapshot.get("todos", []):
+            todos[todo["url"]] = self.create_todo(todo["url"], todo["data"], todo.get("etag"))
+
+        with self.lock:
+            self.todos = todos
+            self.sync_token = snapshot.get("sync_token")
+
+
+class MutationJournal(QtCore.QObject):
+    changed = QtCore.pyqtSignal(str)
+    conflict = QtCore.pyqtSignal()
+
+    retry_delay = 10
+    max_retry_delay = 60 * 60
+
+    # Changes rejected because of a modification by another client, any other error is retried
+    conflict_statuses = (409, 412)
+
+    # Number of requests sent at the same time using the connection pool of the client
+    write_concurrency = 4
+
+    def __init__(self, name: str, todo_list_syncs: Dict[str, TodoListSync]):
+        super().__init__()
+
+        self.todo_list_syncs = todo_list_syncs
+        self.journal_file = get_cache_path("tasks/{}.journal.json".format(name))
+        self.snapshot_file = get_cache_path("tasks/{}.snapshot.json".format(name))
+        self.lock = threading.RLock()
+        self.entries: List[dict] = []
+        self.entry_todos: Dict[str, caldav.Todo] = {}
+
+        if os.path.exists(self.journal_file):
+            with open(self.journal_file, "r") as journal_file:
+                self.entries = json.load(journal_file)
+
+        self.writer_thread = ThreadedCall(self, self.process)
+        self.writer_thread.finished.connect(self.schedule_retry)
+
+        self.retry_timer = QtCore.QTimer(self)
+        self.retry_timer.setSingleShot(True)
+        self.retry_timer.timeout.connect(self.start_writer)
+
+    @staticmethod
+    def write_json(filename: str, data):
+        os.makedirs(os.path.dirname(filename), exist_ok=True)
+
+        temp_file = "{}.tmp".format(filename)
+
+        with open(temp_file, "w") as json_file:
+            json.dump(data, json_file)
+
+        os.rename(temp_file, filename)
+
+    def save(self):
+        with self.lock:
+            self.write_json(self.journal_file, self.entries)
+
+    def save_snapshot(self):
+        with self.lock:
+            self.write_json(self.snapshot_file, {calendar_url: todo_list_sync.to_snapshot() for calendar_url, todo_list_sync in self.todo_list_syncs.items()})
+
+    def load_snapshot(self):
+        if not os.path.exists(self.snapshot_file):
+            return
+
+        with open(self.snapshot_file, "r") as snapshot_file:
+            snapshots = json.load(snapshot_file)
+
+        for calendar_url, snapshot in snapshots.items():
+            if calendar_url in self.todo_list_syncs:
+                self.todo_list_syncs[calendar_url].load_snapshot(snapshot)
+
+    @staticmethod
+    def create_entry(todo: caldav.Todo, action: str, data: str = None, create=False, destination: caldav.Calendar = None):
+        entry = {
+            "id": str(uuid.uuid4()),
+            "calendar": str(todo.parent.url),
+            "url": str(todo.url),
+            "action": action,
+            "data": data,
+            "etag": getattr(todo, "etag", None),
+            "create": create,
+            "attempts": 0,
+            "next_attempt": 0
+        }
+
+        if destination is not None:
+            entry["destination_calendar"] = str(destination.url)
+            entry["destination_url"] = str(destination.url.join(str(todo.url).rstrip("/").rsplit("/", 1)[-1]))
+
+        return entry
+
+    def add_entries(self, entries: List[dict]):
+        if not entries:
+            return
+
+        changed_calendars = set()
+
+        with self.lock:
+            for entry in entries:
+                # Any pending write for the same todo will update the ETag once it has been written
+                for pending_entry in self.entries:
+                    if entry["url"] in (pending_entry["url"], pending_entry.get("destination_url")):
+                        entry["etag"] = pending_entry["etag"]
+
+                self.entries.append(entry)
+
+                changed_calendars.add(entry["calendar"])
+
+                if "destination_calendar" in entry:
+                    changed_calendars.add(entry["destination_calendar"])
+
+        # Write the journal and update the lists only once for the whole batch
+        self.save()
+
+        for calendar_url in changed_calendars:
+            self.changed.emit(calendar_url)
+
+        self.start_writer()
+
+    def save_todo(self, todo: caldav.Todo, create=False):
+        self.save_todos([todo], create)
+
+    def save_todos(self, todos: List[caldav.Todo], create=False):
+        self.add_entries([self.create_entry(todo, "put", todo.vobject_instance.serialize(), create) for todo in todos])
+
+    def delete_todo(self, todo: caldav.Todo):
+        self.delete_todos([todo])
+
+    def delete_todos(self, todos: List[caldav.Todo]):
+        self.add_entries([self.create_entry(todo, "delete") for todo in todos])
+
+    def move_todos(self, todos: List[caldav.Todo], calendar: caldav.Calendar):
+        self.add_entries([self.create_entry(todo, "move", todo.vobject_instance.serialize(), destination=calendar) for todo in todos if str(todo.parent.url) != str(calendar.url)])
+
+    def get_pending_urls(self, calendar_url: str):
+        pending_urls = set()
+
+        with self.lock:
+            for entry in self.entries:
+                if entry["calendar"] == calendar_url:
+                    pending_urls.add(entry["url"])
+
+                if entry.get("destination_calendar") == calendar_url:
+                    pending_urls.add(entry["destination_url"])
+
+        return pending_urls
+
+    def apply_pending(self, calendar_url: str, todos: Dict[str, caldav.Todo]):
+        todo_list_sync = self.todo_list_syncs[calendar_url]
+
+        with self.lock:
+            for entry in self.entries:
+                if entry["action"] == "move":
+                    if entry["calendar"] == calendar_url:
+                        todos.pop(entry["url"], None)
+
+                    if entry["destination_calendar"] != calendar_url:
+                        continue
+
+                    url = entry["destination_url"]
+                elif entry["calendar"] != calendar_url:
+                    continue
+                elif entry["action"] == "delete":
+                    todos.pop(entry["url"], None)
+                    continue
+                else:
+                    url = entry["url"]
+
+                if entry["id"] not in self.entry_todos:
+                    self.entry_todos[entry["id"]] = todo_list_sync.create_todo(url, entry["data"], entry["etag"])
+
+                todo = self.entry_todos[entry["id"]]
+
+                if TodoListSync.is_open_todo(todo.vobject_instance):
+                    todos[url] = todo
+                else:
+                    todos.pop(url, None)
+
+    def start_writer(self):
+        if not self.writer_thread.isRunning():
+            self.writer_thread.start()
+
+    def schedule_retry(self):
+        with self.lock:
+            next_attempts = [entry["next_attempt"] for entry in self.entries]
+
+        if not next_attempts:
+            return
+
+        self.retry_timer.start(max(0, int((min(next_attempts) - time.time()) * 1000)))
+
+    def write_entry(self, entry: dict):
+        todo_list_sync = self.todo_list_syncs[entry["calendar"]]
+        headers = {}
+
+        if entry["action"] == "put":
+            headers["Content-Type"] = "text/calendar; charset=utf-8"
+
+            if entry["create"]:
+                headers["If-None-Match"] = "*"
+            elif entry["etag"]:
+                headers["If-Match"] = entry["etag"]
+
+            return todo_list_sync.calendar.client.request(entry["url"], "PUT", entry["data"], headers)
+        elif entry["action"] == "move":
+            headers["Destination"] = entry["destination_url"]
+            headers["Overwrite"] = "F"
+
+            if entry["etag"]:
+                headers["If-Match"] = entry["etag"]
+
+            return todo_list_sync.calendar.client.request(entry["url"], "MOVE", "", headers)
+        else:
+            if entry["etag"]:
+                headers["If-Match"] = entry["etag"]
+
+            return todo_list_sync.calendar.client.request(entry["url"], "DELETE", "", headers)
+
+    def process(self):
+        with self.lock:
+            entries = list(self.entries)
+
+        # Changes of the same todo have to be written in order, independent todos are written in parallel
+        chains = []
+        url_chains = {}
+
+        for entry in entries:
+            chain = url_chains.get(entry["url"])
+
+            if chain is None:
+                chain = []
+                chains.append(chain)
+
+            chain.append(entry)
+            url_chains[entry["url"]] = chain
+
+            if "destination_url" in entry:
+                url_chains[entry["destination_url"]] = chain
+
+        changed_calendars = set()
+
+        threads = [ThreadedCall(None, self.process_chains, chains[index::self.write_concurrency], changed_calendars) for index in range(min(len(chains), self.write_concurrency))]
+
+        for thread in threads:
+            thread.start()
+
+        for thread in threads:
+            thread.wait()
+
+        self.save()
+
+        for calendar_url in changed_calendars:
+            self.changed.emit(calendar_url)
+
+    def process_chains(self, chains: List[List[dict]], changed_calendars: set):
+        for chain in chains:
+            for entry in chain:
+                # Keep the order of changes for the same todo
+                if not self.process_entry(entry, changed_calendars):
+                    break
+
+    def process_entry(self, entry: dict, changed_calendars: set):
+        if entry["calendar"] not in self.todo_list_syncs:
+            self.remove_entry(entry)
+            return True
+
+        if entry["next_attempt"] > time.time():
+            return False
+
+        try:
+            response = self.write_entry(entry)
+            status = response.status
+        except:
+            traceback.print_exc()
+            status = None
+
+        todo_list_sync = self.todo_list_syncs[entry["calendar"]]
+
+        if status is not None and (200 <= status < 300 or (entry["action"] == "delete" and status == 404)):
+            etag = response.headers.get("ETag")
+
+            if entry["action"] == "put":
+                todo_list_sync.apply_put(entry["url"], entry["data"], etag)
+                url = entry["url"]
+            elif entry["action"] == "move":
+                todo_list_sync.apply_delete(entry["url"])
+                url = entry["destination_url"]
+
+                if entry["destination_calendar"] in self.todo_list_syncs:
+                    self.todo_list_syncs[entry["destination_calendar"]].apply_put(url, entry["data"], etag)
+            else:
+                todo_list_sync.apply_delete(entry["url"])
+                url = entry["url"]
+
+            with self.lock:
+                for pending_entry in self.entries:
+                    if pending_entry["url"] == url:
+                        pending_entry["etag"] = etag
+
+            self.remove_entry(entry)
+            self.add_changed_calendars(changed_calendars, entry)
+            return True
+        elif status in self.conflict_statuses:
+            # Conflict (e.g. modified by another client) -> server state wins
+            print("Discarding {} of todo {} (HTTP status {})".format(entry["action"], entry["url"], status), file=sys.stderr)
+
+            todo_list_sync.invalidate()
+
+            self.remove_entry(entry)
+            self.add_changed_calendars(changed_calendars, entry)
+            self.conflict.emit()
+            return True
+        else:
+            with self.lock:
+                entry["attempts"] += 1
+                entry["next_attempt"] = time.time() + min(self.retry_delay * 2 ** (entry["attempts"] - 1), self.max_retry_delay)
+
+            return False
+
+    def add_changed_calendars(self, changed_calendars: set, entry: dict):
+        with self.lock:
+            changed_calendars.add(entry["calendar"])
+
+            if "destination_calendar" in entry:
+                changed_calendars.add(entry["destination_calendar"])
+
+    def remove_entry(self, entry: dict):
+        with self.lock:
+            self.entries.remove(entry)
+            self.entry_todos.pop(entry["id"], None)
+
+
 class Updater(QtCore.QThread):
-    ready = QtCore.pyqtSignal(dict)
+    list_ready = QtCore.pyqtSignal(str, list)
 
-    def __init__(self, calendars: List[caldav.Calendar], todo_configs: Dict[str, TodoListConfig]):
+    def __init__(self, calendars: List[caldav.Calendar], todo_configs: Dict[str, TodoListConfig], journal_name: str):
         QtCore.QThread.__init__(self)
 
         self.calendars = calendars
         self.todo_configs = todo_configs
+        self.todo_list_syncs = {str(calendar.url): TodoListSync(calendar) for calendar in calendars}
 
-    def get_sort_value(self, todo_entry, sort_key):
-        vtodo = todo_entry.instance.vtodo
-
-        defaults = {
-            "due": "2050-01-01",
-            "dtstart": "1970-01-01",
-            "priority": "0",
-            "isnt_overdue": not (hasattr(vtodo, "due") and vtodo.due.value.strftime("%F%H%M%S") < datetime.datetime.now().strftime("%F%H%M%S")),
-            "hasnt_started": (hasattr(vtodo, "dtstart") and vtodo.dtstart.value.strftime("%F%H%M%S") > datetime.datetime.now().strftime("%F%H%M%S"))
-        }
+        self.journal = MutationJournal(journal_name, self.todo_list_syncs)
+        self.journal.changed.connect(self.emit_todo_list)
+        self.journal.conflict.connect(self.start)
 
+    @staticmethod
+    def get_sort_value(vtodo, sort_key, now: str):
         value = getattr(vtodo, sort_key, None)
+
         if value is None:
-            return defaults.get(sort_key, "0")
+            if sort_key == "due":
+                return "2050-01-01"
+            elif sort_key == "dtstart":
+                return "1970-01-01"
+            elif sort_key == "isnt_overdue":
+                return str(not (hasattr(vtodo, "due") and vtodo.due.value.strftime("%F%H%M%S") < now))
+            elif sort_key == "hasnt_started":
+                return str(hasattr(vtodo, "dtstart") and vtodo.dtstart.value.strftime("%F%H%M%S") > now)
+            else:
+                return "0"
 
         value = value.value
         if hasattr(value, "strftime"):
@@ -466,48 +1660,74 @@ class Updater(QtCore.QThread):
 
         return value
 
-    def compare_todos(self, todo1, todo2, sort_key, asc=True, default_priority_order_number=0):
-        value1 = self.get_sort_value(todo1, sort_key).lower()
-        value2 = self.get_sort_value(todo2, sort_key).lower()
+    def get_sort_key(self, todo_entry, todo_config: TodoListConfig, now: str):
+        vtodo = todo_entry.instance.vtodo
 
-        # Map priority value to default priority number in case it's zero (undefined)
-        if sort_key == "priority" and value1 == "0":
-            value1 = str(default_priority_order_number)
-        if sort_key == "priority" and value2 == "0":
-            value2 = str(default_priority_order_number)
+        sort_key = []
 
-        if value1 > value2:
-            return 1 if asc else -1
-        elif value1 < value2:
-            return -1 if asc else 1
-        else:
-            return 0
+        for key in todo_config.sort.keys():
+            value = self.get_sort_value(vtodo, key, now).lower()
 
-    def sort_function(self, todo1, todo2, todo_config: TodoListConfig):
-        for sort_key, sort_direction in todo_config.sort.items():
-            compare_value = self.compare_todos(todo1, todo2, sort_key, sort_direction.lower() == "asc", todo_config.default_priority_order_number)
+            # Map priority value to default priority number in case it's zero (undefined)
+            if key == "priority" and value == "0":
+                value = str(todo_config.default_priority_order_number)
 
-            if compare_value != 0:
-                return compare_value
+            sort_key.append(value)
 
-        return 0
+        return tuple(sort_key)
 
-    def run(self):
-        try:
-            todos = {}
+    def sort_todos(self, todos: list, todo_config: TodoListConfig):
+        # Capture the current time once instead of per comparison
+        now = datetime.datetime.now().strftime("%F%H%M%S")
+
+        keyed_todos = [(self.get_sort_key(todo, todo_config, now), todo) for todo in todos]
 
-            for calendar in self.calendars:
-                todo_config = self.todo_configs[calendar.name]
-                calendar_todos = calendar.todos(sort_keys=[])
+        # Stable sort by each key starting with the least significant one to honor the direction per key
+        for index, sort_direction in reversed(list(enumerate(todo_config.sort.values()))):
+            keyed_todos.sort(key=lambda keyed_todo: keyed_todo[0][index], reverse=sort_direction.lower() != "asc")
 
-                calendar_todos.sort(key=cmp_to_key(lambda todo1, todo2: self.sort_function(todo1, todo2, todo_config)))
+        return [todo for _, todo in keyed_todos]
 
-                todos[str(calendar.url)] = calendar_todos
+    def emit_todo_list(self, calendar_url: str):
+        todo_list_sync = self.todo_list_syncs[calendar_url]
+        todo_config = self.todo_configs[todo_list_sync.calendar.name]
 
-            self.ready.emit(todos)
+        todos = todo_list_sync.get_todos()
+
+        # Show local changes which have not been written to the server yet
+        self.journal.apply_pending(calendar_url, todos)
+
+        self.list_ready.emit(calendar_url, self.sort_todos(list(todos.values()), todo_config))
+
+    def load_snapshot(self):
+        try:
+            self.journal.load_snapshot()
+        except:
+            traceback.print_exc()
+            return
+
+        for calendar_url in self.todo_list_syncs.keys():
+            self.emit_todo_list(calendar_url)
+
+    def update_todo_list(self, calendar: caldav.Calendar):
+        try:
+            if self.todo_list_syncs[str(calendar.url)].sync():
+                self.journal.save_snapshot()
+
+            self.emit_todo_list(str(calendar.url))
         except:
             traceback.print_exc()
 
+    def run(self):
+        # Fetch all lists in parallel and emit each one as soon as it is available
+        threads = [ThreadedCall(None, self.update_todo_list, calendar) for calendar in self.calendars]
+
+        for thread in threads:
+            thread.start()
+
+        for thread in threads:
+            thread.wait()
+
 
 class View(QtWidgets.QWidget, AbstractView):
     def __init__(self, url, username, password, todo_lists=None, default_todo_list=None, sort_todos=None, todos_reversed=False, default_priority_order_number=0, show_add_todo=True, show_before_start=None, item_style: dict=None):
@@ -531,8 +1751,7 @@ class View(QtWidgets.QWidget, AbstractView):
 
         self.default_todo_list = default_todo_list
         self.todo_lists = {}
-        self.last_overdue_todo = (None, None)
-
+        self.todo_index = TodoIndex()
         self.important_icon = QtGui.QIcon.fromTheme("error-app-symbolic")
 
         self.calendar_manager = CalendarManager(url, username, password, todo_lists)
@@ -552,8 +1771,10 @@ class View(QtWidgets.QWidget, AbstractView):
             for name in todo_lists:
                 todo_configs[name] = TodoListConfig(name, {}, sort_todos, default_priority_order_number)
 
-        self.updater = Updater(self.calendar_manager.todo_lists, todo_configs)
-        self.updater.ready.connect(self.update_calendars)
+        journal_name = hashlib.sha1("{}|{}".format(url, username).encode("utf-8")).hexdigest()
+
+        self.updater = Updater(self.calendar_manager.todo_lists, todo_configs, journal_name)
+        self.updater.list_ready.connect(self.update_calendar)
 
         layout = QtWidgets.QVBoxLayout()
         self.setLayout(layout)
@@ -595,7 +1816,8 @@ class View(QtWidgets.QWidget, AbstractView):
             if calendar.name not in todo_lists_list:
                 continue
 
-            todo_list_widget = TodoListWidget(self, calendar, self.calendar_manager, self.updater, show_before_start, item_style)
+            todo_list_widget = TodoListWidget(self, calendar, self.calendar_manager, self.updater.journal, self.todo_index, show_before_start, item_style)
+            todo_list_widget.deadlines_passed.connect(lambda widget=todo_list_widget: self.update_todo_list_tab(widget))
 
             self.todo_lists[str(calendar.url)] = todo_list_widget
             todo_tabs.append((todo_list_widget, calendar.name))
@@ -614,49 +1836,53 @@ class View(QtWidgets.QWidget, AbstractView):
         timer = Timer(self, 300000, self)
         timer.timeout.connect(self.updater.start)
 
-    def update_calendars(self, todos_per_calendar: Dict[str, List[caldav.Todo]]):
-        self.last_overdue_todo = (None, None)
+    def start_view(self):
+        # Show the last known todos until the first sync has finished and write pending changes of the last session
+        self.updater.load_snapshot()
+        self.updater.journal.start_writer()
 
-        for calendar in self.calendar_manager.todo_lists:
-            calendar_id = str(calendar.url)
+    def update_calendar(self, calendar_id: str, todos: List[caldav.Todo]):
+        todo_list_widget = self.todo_lists.get(calendar_id)
 
-            if calendar_id not in self.todo_lists or calendar_id not in todos_per_calendar:
-                continue
+        if todo_list_widget is None:
+            return
 
-            self.update_todo_list(self.todo_lists[calendar_id], todos_per_calendar[calendar_id], calendar)
+        todo_list_widget.update_items(todos)
 
-        self.overdue_todo_button.setVisible(self.last_overdue_todo[0] is not None)
+        # Subtasks of this list might be shown in other lists
+        for other_todo_list_widget in self.todo_lists.values():
+            if other_todo_list_widget is not todo_list_widget:
+                other_todo_list_widget.refresh_foreign_child_items()
 
-    def update_todo_list(self, todo_list_widget: TodoListWidget, todos: List[caldav.Todo], calendar: Calendar):
-        todo_list_widget.update_items(todos)
+        self.update_todo_list_tab(todo_list_widget)
 
-        if todo_list_widget.overdue_todo_item is None:
-            found_overdue_todo = False
-        else:
-            found_overdue_todo = True
-            self.last_overdue_todo = (todo_list_widget, todo_list_widget.overdue_todo_item)
+    def update_todo_list_tab(self, todo_list_widget: TodoListWidget):
+        calendar = todo_list_widget.calendar
+        found_overdue_todo = todo_list_widget.overdue_todo_item is not None
 
         tab_index = self.tab_widget.indexOf(todo_list_widget)
 
-        self.tab_widget.setTabText(tab_index, "{} ({})".format(calendar.name, len(todos)))
+        self.tab_widget.setTabText(tab_index, "{} ({})".format(calendar.name, len(todo_list_widget.todos)))
         self.tab_widget.setTabIcon(tab_index, self.important_icon if found_overdue_todo else calendar.get_icon())
 
-    def show_overdue_todo(self):
-        tab_page_widget: QtWidgets.QListWidget
-        todo_item: caldav.Todo
+        self.overdue_todo_button.setVisible(self.todo_index.get_overdue_item() is not None)
 
-        tab_page_widget, todo_item = self.last_overdue_todo
+    def show_overdue_todo(self):
+        todo_item = self.todo_index.get_overdue_item()
 
-        if tab_page_widget is None or todo_item is None:
+        if todo_item is None:
             return
 
-        self.tab_widget.setCurrentWidget(tab_page_widget)
+        todo_list_widget = self.todo_index.get_list_widget(todo_item)
+
+        self.tab_widget.setCurrentWidget(todo_list_widget)
+        todo_list_widget.show_todo_item(todo_item)
 
     def show_todo_dialog(self, position: QtCore.QPoint = None, todo_list: str = None, title: str = None, notes: str = None):
         if todo_list is None:
             todo_list = self.default_todo_list
 
-        dialog = TodoDialog(self, self.calendar_manager.todo_lists, todo_list, updater_thread=self.updater)
+        dialog = TodoDialog(self, self.calendar_manager.todo_lists, todo_list, journal=self.updater.journal)
 
         if position is not None:
             dialog.move(position)
@@ -677,8 +1903,7 @@ class View(QtWidgets.QWidget, AbstractView):
 
         calendar: caldav.Calendar = self.tab_widget.currentWidget().calendar
 
-        TodoItem.create(calendar, text)
-        self.updater.start()
+        self.updater.journal.save_todo(TodoItem.create(calendar, text), True)
         self.add_todo_field.clear()
 
     def update_add_todo_button(self):
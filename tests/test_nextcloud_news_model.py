@@ -0,0 +1,138 @@
+import os
+import random
+
+import pytest
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+from PyQt5 import QtCore, QtGui, QtWidgets
+from PyQt5.QtTest import QAbstractItemModelTester
+
+from modules.nextcloud_news import NewsModel, NewsNode
+
+
+class FeedIconCache(QtCore.QObject):
+    icon_ready = QtCore.pyqtSignal(int)
+
+    def get_icon(self, feed_id: int):
+        return QtGui.QIcon()
+
+
+@pytest.fixture(scope="module")
+def application():
+    return QtWidgets.QApplication.instance() or QtWidgets.QApplication([])
+
+
+@pytest.fixture
+def model_test_failures():
+    failures = []
+
+    def message_handler(message_type, context, message):
+        if "FAIL" in message:
+            failures.append(message)
+
+    previous_handler = QtCore.qInstallMessageHandler(message_handler)
+
+    yield failures
+
+    QtCore.qInstallMessageHandler(previous_handler)
+
+
+def create_model():
+    model = NewsModel(None, FeedIconCache())
+    tester = QAbstractItemModelTester(model, QAbstractItemModelTester.FailureReportingMode.Warning)
+
+    return model, tester
+
+
+def create_folders(folders: dict):
+    folder_nodes = []
+
+    for folder_name, feeds in folders.items():
+        folder_node = NewsNode("folder", folder_name, sum(len(entries) for entries in feeds.values()))
+
+        for feed_name, entries in feeds.items():
+            feed_node = NewsNode("feed", feed_name, len(entries), feed_id=1)
+
+            for entry_id in entries:
+                feed_node.add_child(NewsNode("entry", entry_id, entry={"id": entry_id, "title": str(entry_id), "pubDate": entry_id}))
+
+            folder_node.add_child(feed_node)
+
+        folder_nodes.append(folder_node)
+
+    return folder_nodes
+
+
+def assert_structure(model: NewsModel, folders: dict):
+    structure = {}
+
+    for folder_row in range(model.rowCount()):
+        folder_index = model.index(folder_row, 0)
+        feeds = {}
+
+        assert model.parent(folder_index) == QtCore.QModelIndex()
+
+        for feed_row in range(model.rowCount(folder_index)):
+            feed_index = model.index(feed_row, 0, folder_index)
+            entries = []
+
+            assert model.parent(feed_index) == folder_index
+
+            for entry_row in range(model.rowCount(feed_index)):
+                entry_index = model.index(entry_row, 0, feed_index)
+
+                assert model.parent(entry_index) == feed_index
+
+                entries.append(entry_index.internalPointer().key)
+
+            feeds[feed_index.internalPointer().key] = entries
+
+        structure[folder_index.internalPointer().key] = feeds
+
+    assert structure == folders
+
+
+def test_remove_folder_and_insert_entry(application, model_test_failures):
+    model, tester = create_model()
+
+    model.update_children(model.root, create_folders({"A": {"a": [1]}, "B": {"b": [2]}, "C": {"c": [3]}}))
+
+    folders = {"B": {"b": [2, 4]}, "C": {"c": [3]}}
+    inserted_parents = []
+
+    model.rowsInserted.connect(lambda parent, first, last: inserted_parents.append(parent.internalPointer().key))
+    model.update_children(model.root, create_folders(folders))
+
+    assert inserted_parents == ["b"]
+    assert_structure(model, folders)
+    assert model_test_failures == []
+
+
+def test_random_updates(application, model_test_failures):
+    model, tester = create_model()
+    randomizer = random.Random(0)
+
+    for _ in range(50):
+        folders = {}
+
+        for folder_name in randomizer.sample("ABCDEFGH", randomizer.randint(0, 8)):
+            feeds = {}
+
+            for feed_name in randomizer.sample("abcdef", randomizer.randint(1, 6)):
+                feeds["{}{}".format(folder_name, feed_name)] = sorted(randomizer.sample(range(20), randomizer.randint(1, 10)), reverse=True)
+
+            folders[folder_name] = feeds
+
+        persistent_indexes = [(QtCore.QPersistentModelIndex(model.index(row, 0)), model.index(row, 0).internalPointer()) for row in range(model.rowCount())]
+
+        model.update_children(model.root, create_folders(folders))
+
+        assert_structure(model, folders)
+
+        for persistent_index, node in persistent_indexes:
+            if persistent_index.isValid():
+                assert QtCore.QModelIndex(persistent_index).internalPointer() is node
+                assert persistent_index.row() == node.row
+
+    assert model_test_failures == []